@@ -1,43 +1,204 @@
-import RPi.GPIO as GPIO
-import time
+import os, select, threading, collections
+from clock import monotonic
 
+# RPi.GPIO is needed only by this backend, character device backend (gpio_buttons.py) works without it
+try:
+	import RPi.GPIO as GPIO
+except ImportError:
+	GPIO = None
+
+# Buttons are pulled up, so pressed button reads 0
+PRESSED = 0
+RELEASED = 1
+
+# Actions which are replaced by another one when button is held longer than LONG_PRESS_TIME (in seconds)
+# Normal action is done when button is released sooner
+LONG_ACTIONS = {'PLAY': 'STOP'}
+LONG_PRESS_TIME = 1.0
+
+# Actions which are repeated while button is held, after REPEAT_DELAY, first with REPEAT_INTERVAL
+# Every repeat makes the interval shorter (REPEAT_ACCELERATION), down to REPEAT_INTERVAL_MIN (all in seconds)
+REPEAT_ACTIONS = ('VUP', 'VDN')
+REPEAT_DELAY = 0.5
+REPEAT_INTERVAL = 0.25
+REPEAT_ACCELERATION = 0.8
+REPEAT_INTERVAL_MIN = 0.08
+
+# State of one button, it's changed only by dispatcher thread
+class button():
+	# Class constructor, receives action of the button
+	def __init__(self, action):
+		self.action = action
+		
+		# Last level we got and when, level which stayed long enough (debounced)
+		self.level = RELEASED
+		self.changed_at = 0
+		self.state = RELEASED
+		
+		# When something should happen while it's held (long press or repeat), None - nothing
+		self.next_at = None
+		self.interval = REPEAT_INTERVAL
+		
 # This class will send commands to MPD client from buttons
+# GPIO callback only records the edge, dispatcher thread debounces it and decides what to do,
+# so slow MPD can't delay or lose edges
 class buttons():
 	# Class constructor
 	# Buttons pins is a dictionary with button_name=>pin_number format
+	# Bounce time is how long the level must stay the same to be accepted (in miliseconds)
 	def __init__(self, button_pins, bounce_time):
 		# Set bounce time
-		self.bounce_time = bounce_time
+		self.settle_time = bounce_time / 1000.0
+		
+		# Set buttons, pin => button
+		self.buttons = {}
+		for name in button_pins:
+			if (button_pins[name] != False):
+				self.buttons[button_pins[name]] = button(name.replace('_BUTTON', ''))
+				
+		# Recorded edges (pin, level, time), deque can be appended from GPIO thread without locking
+		# Pipe wakes dispatcher thread up
+		self.edges = collections.deque()
+		self.wake_read, self.wake_write = os.pipe()
+		
+		# Other file descriptors dispatcher thread waits for, their edges are read by read_events
+		self.event_fds = []
 		
-		# Set buttons
-		self.buttons = button_pins
-	
+		self.setup_pins()
+		
+		# Initalize MPD
+		self.mpd = False
+		
+		# No thread currently
+		self.btn_t = False
+		
+	# Set button pins as inputs and enable interrupts
+	def setup_pins(self):
 		# Set GPIO numbering mode
 		GPIO.setmode(GPIO.BOARD)
 		
 		# We don't need warnings from GPIO
 		GPIO.setwarnings(False)
 		
-		# Set button GPIO pins as inputs and enable interrupts
-		for button in button_pins:
-			if (button_pins[button] != False):
-				GPIO.setup(button_pins[button], GPIO.IN, pull_up_down = GPIO.PUD_UP)
-				GPIO.add_event_detect(button_pins[button], GPIO.FALLING, callback=self.button_pressed, bouncetime=self.bounce_time)
-			
-		# Initalize MPD
-		self.mpd = False
+		# Set button GPIO pins as inputs and enable interrupts on both edges (release is needed for long press)
+		# Debouncing is done by dispatcher, GPIO bounce time would lose edges
+		for pin in self.buttons:
+			GPIO.setup(pin, GPIO.IN, pull_up_down = GPIO.PUD_UP)
+			GPIO.add_event_detect(pin, GPIO.BOTH, callback=self.button_changed)
 			
+	# Read edges from file descriptor in event_fds and put them into edges, it's called by dispatcher thread
+	def read_events(self, fd):
+		pass
+		
 	# Register MPD client to send it commands
 	def register(self, mpd):
 		self.mpd = mpd
+		
+	# GPIO callback, it only records the edge
+	def button_changed(self, channel):
+		self.edge(channel, GPIO.input(channel), monotonic())
+		
+	# Record the edge and wake dispatcher up, it never blocks
+	def edge(self, pin, level, timestamp):
+		self.edges.append((pin, level, timestamp))
+		os.write(self.wake_write, 'x')
+		
+	# Send action to MPD client
+	def do_action(self, action):
+		if (self.mpd != False):
+			self.mpd.commands(action)
+			
+	# Button was pressed (debounced)
+	def pressed(self, temp, now):
+		# Wait for release or long press
+		if (temp.action in LONG_ACTIONS):
+			temp.next_at = now + LONG_PRESS_TIME
+			return
+			
+		self.do_action(temp.action)
+		
+		if (temp.action in REPEAT_ACTIONS):
+			temp.next_at = now + REPEAT_DELAY
+			temp.interval = REPEAT_INTERVAL
+			
+	# Button was released (debounced)
+	def released(self, temp):
+		# Released before long press, so it was a short one
+		if (temp.action in LONG_ACTIONS and temp.next_at != None):
+			self.do_action(temp.action)
+			
+		temp.next_at = None
+		
+	# Button is still held and its time has come
+	def held(self, temp, now):
+		if (temp.action in LONG_ACTIONS):
+			self.do_action(LONG_ACTIONS[temp.action])
+			temp.next_at = None
+			return
 			
-	def button_pressed(self, channel):
-		# Debouncing
-		time.sleep(0.05)
-		if (GPIO.input(channel) == 0):
-			# Find out which button was pressed
-			for button in self.buttons:
-				if (channel == self.buttons[button]):					
-					# Send command to MPD client
-					if (self.mpd != False):
-						self.mpd.commands(button.replace('_BUTTON', ''))
\ No newline at end of file
+		self.do_action(temp.action)
+		temp.next_at = now + temp.interval
+		temp.interval = max(temp.interval * REPEAT_ACCELERATION, REPEAT_INTERVAL_MIN)
+		
+	# Check button state, level which stayed for settle time is accepted
+	def update(self, temp, now):
+		if (temp.level != temp.state and (now - temp.changed_at) >= self.settle_time):
+			temp.state = temp.level
+			
+			if (temp.state == PRESSED):
+				self.pressed(temp, now)
+			else:
+				self.released(temp)
+				
+		if (temp.state == PRESSED and temp.next_at != None and now >= temp.next_at):
+			self.held(temp, now)
+			
+	# Return how long dispatcher can wait for edges, None - until next edge
+	def get_timeout(self, now):
+		deadlines = []
+		
+		for temp in self.buttons.values():
+			if (temp.level != temp.state):
+				deadlines.append(temp.changed_at + self.settle_time)
+			if (temp.state == PRESSED and temp.next_at != None):
+				deadlines.append(temp.next_at)
+				
+		if not deadlines:
+			return None
+			
+		return max(min(deadlines) - now, 0)
+		
+	# Dispatcher thread
+	def buttons_thread(self):
+		while True:
+			ready = select.select([self.wake_read] + self.event_fds, [], [], self.get_timeout(monotonic()))[0]
+			
+			for fd in ready:
+				# Drain the pipe before taking edges, so byte of a newer edge can only wake us up again
+				if (fd == self.wake_read):
+					os.read(self.wake_read, 4096)
+				else:
+					self.read_events(fd)
+					
+			while self.edges:
+				pin, level, timestamp = self.edges.popleft()
+				
+				temp = self.buttons.get(pin)
+				if (temp != None):
+					temp.level = level
+					temp.changed_at = timestamp
+					
+			now = monotonic()
+			for temp in self.buttons.values():
+				self.update(temp, now)
+				
+	# Start dispatcher thread
+	def start(self):
+		self.btn_t = threading.Thread(target=self.buttons_thread, args = ()) # Create thread for dispatching buttons
+		self.btn_t.daemon = True # Yep, it's a daemon, when main thread finish, this one will finish too
+		self.btn_t.start() # Start it!
+		
+	# Function for waiting the thread to finish
+	def join(self):
+		if (self.btn_t != False):
+			self.btn_t.join()
@@ -0,0 +1,30 @@
+import time, ctypes, ctypes.util, os
+
+# Monotonic clock (CLOCK_MONOTONIC, seconds since boot, float); it never jumps when system time
+# is set (NTP, fake-hwclock), so it's used for all deadlines, intervals and interpolated times
+# Python 3 has it, on Python 2 it's read directly from C library
+
+# CLOCK_MONOTONIC from <time.h>
+CLOCK_MONOTONIC = 1
+
+# struct timespec: seconds and nanoseconds
+class timespec(ctypes.Structure):
+	_fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+if hasattr(time, 'monotonic'):
+	monotonic = time.monotonic
+
+else:
+	# clock_gettime is in librt with older C libraries, newer have it in libc too
+	librt = ctypes.CDLL(ctypes.util.find_library('rt') or ctypes.util.find_library('c'), use_errno=True)
+	clock_gettime = librt.clock_gettime
+	clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+
+	# Return current monotonic time in seconds (float)
+	def monotonic():
+		temp = timespec()
+		if (clock_gettime(CLOCK_MONOTONIC, ctypes.byref(temp)) != 0):
+			error = ctypes.get_errno()
+			raise OSError(error, os.strerror(error))
+
+		return temp.tv_sec + temp.tv_nsec * 1e-9
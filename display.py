@@ -1,5 +1,122 @@
-import time, math, threading, abc, socket, fcntl, struct, sys, os
+import time, math, threading, abc, sys, os, select, collections, heapq, system_metrics, network_monitor, event_bus
+from clock import monotonic
 
+# CGRAM has room for 8 custom characters, this class decides which one goes where
+# Slots are used as LRU cache: glyph which wasn't used for the longest time is replaced
+class cgram_cache:
+	# Receives function which uploads one glyph: load(slot, bitmap)
+	def __init__(self, load, slots=8):
+		self.load = load
+		
+		# Loaded glyphs (bitmap => slot), least recently used first
+		self.glyphs = collections.OrderedDict()
+		
+		# Slots which are still empty
+		self.free = range(slots)
+		
+		# Statistics
+		self.hits = 0
+		self.uploads = 0
+		
+	# Return slot with given glyph, upload it first if it isn't loaded
+	def get(self, bitmap):
+		key = tuple(bitmap)
+		
+		# Already loaded, just mark it as recently used
+		if key in self.glyphs:
+			slot = self.glyphs.pop(key)
+			self.glyphs[key] = slot
+			self.hits += 1
+			return slot
+			
+		# Take an empty slot, or replace least recently used glyph
+		if self.free:
+			slot = self.free.pop(0)
+		else:
+			slot = self.glyphs.popitem(last=False)[1]
+			
+		self.load(slot, bitmap)
+		self.uploads += 1
+		self.glyphs[key] = slot
+		
+		return slot
+		
+
+# All writes to LCD are done by one thread, which draws frames from this queue
+# If new frames come faster than LCD can draw them, only the newest one is drawn
+class frame_writer:
+	# Receives display (for lcd_* methods) and queue size
+	def __init__(self, display, size=4):
+		self.display = display
+		self.frames = collections.deque(maxlen=size)
+		self.ready = threading.Condition()
+		
+		# Backlight state to set (None - no change)
+		self.backlight = None
+		
+		# Glyphs which are currently in LCD CGRAM, for each slot
+		self.loaded = [None] * 8
+		
+		# Statistics
+		self.submitted = 0
+		self.coalesced = 0
+		self.drawn = 0
+		
+	# Add frame to the queue, it never blocks; frame is a list of rows and CGRAM glyphs it needs
+	def submit(self, rows, glyphs):
+		with self.ready:
+			# Queue is full, the oldest frame will be dropped
+			if (len(self.frames) == self.frames.maxlen):
+				self.coalesced += 1
+				
+			self.frames.append((rows, glyphs))
+			self.submitted += 1
+			self.ready.notify()
+			
+	# Set backlight state, it's also done by writer thread
+	def set_backlight(self, state):
+		with self.ready:
+			self.backlight = state
+			self.ready.notify()
+			
+	# Draw the newest frame (and set backlight) if there's something to do
+	def draw_pending(self):
+		with self.ready:
+			frame = None
+			if self.frames:
+				frame = self.frames.pop()
+				self.coalesced += len(self.frames)
+				self.frames.clear()
+				
+			backlight = self.backlight
+			self.backlight = None
+			
+		if (backlight != None):
+			self.display.lcd_backlight(backlight)
+			
+		if (frame == None):
+			return
+			
+		rows, glyphs = frame
+		
+		# Upload custom characters which this frame needs and LCD doesn't have
+		for slot in range(len(glyphs)):
+			if (glyphs[slot] != None and glyphs[slot] != self.loaded[slot]):
+				self.display.lcd_load_custom_char(slot, glyphs[slot])
+				self.loaded[slot] = glyphs[slot]
+				
+		self.display.lcd_message('\n'.join(rows))
+		self.drawn += 1
+		
+	# Main function of writer thread
+	def run(self):
+		while True:
+			with self.ready:
+				while (not self.frames and self.backlight == None):
+					self.ready.wait()
+					
+			self.draw_pending()
+			
 class display:
 	__metaclass__ = abc.ABCMeta
 
@@ -10,23 +127,29 @@ class display:
 		self.rows = rows
 		self.columns = columns
 		
-		# Default update time (period)
-		self.period = 0.01 # s
-		
 		# Backlight state (needed for toggle)
 		self.backlight_state = True
 		
 		# Initialize LCD
 		self.lcd_initialize()
 		
-		# Unlock the display; this variable is used to prevent multiple write to display
-		self.lock_display = False
+		# Only writer thread writes to the display
+		self.writer = frame_writer(self)
+		
+		# Temporary screen period (volume, repeat, shuffle...), in seconds
+		self.temporary_screen_period = temp_screen_period
 		
-		# Temporary screen period (volume, repeat, shuffle...)
-		self.temporary_screen_period = temp_screen_period / self.period # We have to divide it with period
+		# Scroll period, in seconds
+		self.scroll_period = scroll_period
 		
-		# Scroll period
-		self.scroll_period = scroll_period / self.period # We have to divide it with period
+		# Display thread waits on this pipe until it's notified (a byte is written) or until the next deadline
+		# select sleeps for the whole timeout, condition with timeout would poll (Python 2)
+		self.wake_read, self.wake_write = os.pipe()
+		
+		# Deadlines: heap with (time, name) and the current time for each name
+		# Old heap entries (rescheduled or cancelled) are skipped when they come out
+		self.deadlines = []
+		self.timers = {}
 		
 		# Create array for storing data for display
 		# Each element represents one row, and it contains string
@@ -38,11 +161,15 @@ class display:
 			for j in range(self.columns):
 				self.display_data[i] = self.display_data[i] + ' '
 				
-		# Prepare global data for scrolling
+		# Prepare global data for scrolling: text, its frames and the position in frames
 		self.scroll = []
-		for i in range(self.columns):
-			temp = {'data' : '', 'position' : 0, 'direction' : 0}
+		for i in range(self.rows):
+			temp = {'data' : None, 'frames' : (), 'position' : 0}
 			self.scroll.append(temp.copy())
+			
+		# Already computed scroll frames, (text, width) => frames, least recently used first
+		self.scroll_cache = collections.OrderedDict()
+		self.scroll_cache_size = 16
 		
 		# Select first screen
 		self.screen = 0
@@ -53,8 +180,32 @@ class display:
 		# Initially, there's no temporary screen (like volume)
 		self.temporary_screen = False
 		
-		# Current wait time for display
-		self.wait_time = 0
+		# Time to wait before next refresh (in seconds), screens set it
+		# None means that screen shows only data which changes with notifications
+		self.wait_time = None
+		
+		# How often are IP address, CPU temperature and RAM usage refreshed, in seconds
+		self.system_period = 5
+		
+		# CPU temperature and RAM usage are sampled with the same period
+		self.metrics = system_metrics.system_metrics(self.system_period)
+		
+		# IP addresses are followed by network monitor, it notifies us when they change
+		self.network = network_monitor.network_monitor()
+		self.network.register(self)
+		
+		# Each screen consists of regions (one or more rows) which are refreshed separately
+		# Region: name (also used for its deadline), function and notifications it depends on
+		# Notifications are names of changed MPD data (for example 'artist', 'bitrate')
+		# or 'network' - IP address changed
+		self.screen_regions = [
+			[('scroll', self.screen_0, ('artist', 'title'))],
+			[('time', self.screen_1_time, ('elapsed_time', 'total_time', 'state', 'type')), ('info', self.screen_1_info, ('type', 'bitrate'))],
+			[('network', self.screen_2, ('network',))],
+			[('uptime', self.screen_3, ('playtime', 'uptime', 'state'))],
+			[('clock', self.screen_4, ())],
+			[('system', self.screen_5, ())]
+		]
 		
 		# Initially, we don't have to show volume screen
 		self.volume_screen = False
@@ -65,19 +216,23 @@ class display:
 		self.play_mode_type = 0
 		self.play_mode_state = False
 		
+		# Snapshot of MPD data which is shown, see mpd_client.player_state
+		self.state = None
+		
 		# Initially, data didn't changed
 		self.data_changed = False
-		self.time_changed = False
-		
-		# We don't have enough space for custom characters so we have to load them when needed
-		# But it takes resources so we will load them into LCD only if needed
-		# This variable contains currently loaded characters:
-		# 0 - play/pause/stop icons
-		# 1 - volume
-		# 2 - shuffle
-		# 3 - repeat all
-		# 4 - repeat single
-		self.current_custom_chars = -1 # Initially we want it to load something
+		self.network_changed = False
+		self.screen_changed = True # First screen has to be drawn
+		
+		# MPD connection state, while it isn't connected we show connecting screen
+		self.mpd_connected = True
+		self.connection_change = False
+		
+		# We don't have enough space for all custom characters so we have to load them when needed
+		# CGRAM cache loads only glyphs which aren't already in the LCD
+		# Glyphs are only assigned to slots here, writer uploads them before drawing the frame
+		self.cgram_slots = [None] * 8
+		self.cgram = cgram_cache(self.assign_glyph)
 		
 		# Icons for display
 		self.display_icons = [
@@ -117,90 +272,101 @@ class display:
 	
 	''' ABSTRACT METHOD, YOU HAVE TO IMPLEMENT IT IN INHERITED CLASS '''	
 	@abc.abstractmethod
-	def lcd_load_custom_chars(self, data): 
-		# This method loads custom characters in LCD display
-		# It receives an array with data for each custom character
-		# Each array item contains 8 values for each line in one box
+	def lcd_load_custom_char(self, slot, data): 
+		# This method loads one custom character in LCD display, on place 'slot' (0 - 7)
+		# It receives 8 values for each line in one box
 		''' EXAMPLE '''
-		''' data = [
-				[ 0b00000, 0b11111, 0b11111, 0b11111, 0b11111, 0b11111, 0b11111, 0b00000 ],
-				[ 0b00000, 0b01000, 0b01100, 0b01110, 0b01110, 0b01100, 0b01000, 0b00000 ],
-				[ 0b00000, 0b01010, 0b01010, 0b01010, 0b01010, 0b01010, 0b01010, 0b00000 ]
-		] '''
-		# This will load 3 custom characters (stop, play, pause icons) on places 0-2
+		''' data = [ 0b00000, 0b01000, 0b01100, 0b01110, 0b01110, 0b01100, 0b01000, 0b00000 ] '''
+		# With slot 1, this will load play icon on place 1; CGRAM cache decides which glyph goes where
 		return
 		
+	# Return character which shows given custom glyph, it's loaded into LCD if needed
+	def glyph(self, bitmap):
+		return chr(self.cgram.get(bitmap))
+		
+	# Remember which glyph is in which CGRAM slot, for next frames
+	def assign_glyph(self, slot, bitmap):
+		self.cgram_slots[slot] = tuple(bitmap)
+		
 	# We need to register MPD client to be able to retrieve data from it
+	# Display also subscribes to its changes
 	def register(self, mpd):
 		self.mpd = mpd
+		self.state = mpd.getData()
 		
-	# Function for updating LCD display
+		mpd.bus.subscribe('lcd', {
+			event_bus.VOLUME_CHANGED: self.volume_changed,
+			event_bus.PLAY_MODE_CHANGED: self.play_mode_changed,
+			event_bus.DATA_CHANGED: self.data_change,
+			event_bus.CONNECTION_CHANGED: self.connection_changed
+		})
+		
+		# Connection could change before we subscribed, so start from its current state
+		self.connection_changed(mpd.connected)
+		
+	# Function for updating LCD display, frame is sent to the writer thread
 	def update_display(self):
-		tmp = '';
-		# Iterate through all lines
-		for i in range(self.rows):
-			tmp = tmp + self.display_data[i];
-			if (i != (self.rows - 1)):
-				tmp = tmp + '\n';
-
-		self.lcd_message(tmp);
+		self.writer.submit(list(self.display_data[:self.rows]), tuple(self.cgram_slots))
+		
+	# Return writer statistics: frames submitted, coalesced (dropped) and drawn
+	def get_writer_stats(self):
+		return {
+			'submitted': self.writer.submitted,
+			'coalesced': self.writer.coalesced,
+			'drawn': self.writer.drawn
+		}
 		
 	# Function for toggling on/off LCD backlight
 	def toggle_backlight(self):
-		# If it's on currently, turn it off
-		if self.backlight_state:
-			self.lcd_backlight(False)
-			self.backlight_state = False
-		
-		# Otherwise, turn it on
-		else:
-			self.lcd_backlight(True)
-			self.backlight_state = True
+		self.backlight_state = not self.backlight_state
+		self.writer.set_backlight(self.backlight_state)
+			
+	# Return all frames for scrolling text on the row with given width
+	# Text goes forwards and then backwards, last frame is followed by the first one again
+	# Frames are computed only once for each text and kept in a small cache
+	def scroll_frames(self, text, width):
+		key = (text, width)
+		
+		# Take it from cache, it's moved to the end (recently used)
+		frames = self.scroll_cache.pop(key, None)
+		
+		if (frames == None):
+			# Maybe there's no need to scroll, if text is shorter than LCD width, fill the rest with spaces
+			if (len(text) <= width):
+				frames = (text.ljust(width),)
+				
+			# Positions go 0, 1 ... last, last - 1 ... 0
+			else:
+				last = len(text) - width
+				positions = range(last + 1) + range(last - 1, -1, -1)
+				frames = tuple([text[i:i + width] for i in positions])
+				
+			# Cache is full, remove least recently used
+			if (len(self.scroll_cache) >= self.scroll_cache_size):
+				self.scroll_cache.popitem(last=False)
 			
+		self.scroll_cache[key] = frames
+		
+		return frames
+		
 	# Function for scrolling text, receives row id and text
 	# Every time it's called, it will scroll one character
 	# If it reaches the end, it will change direction
 	# If the text changes, it will start from scratch
 	# It returns the text ready for display; it checks if there's a need to scroll or not
-	# It uses global variables for current position, direction and data to scroll
 	def scroll_row(self, row, text):
-		# Maybe there's no need to scroll
-		if (len(text) == self.columns):
-			return text
-			
-		# If text is shorter than LCD width, fill the rest with spaces
-		elif (len(text) < self.columns):
-			temp = text
-			for i in range(self.columns - len(text)):
-				temp = temp + ' '
-				
-			return temp
+		scroll = self.scroll[row] # scroll[row] is a dictionary with scrolling data for 'row'
 		
 		# Check if text has changed
-		if(self.scroll[row]['data'] != text): # scroll[row] is a dictionary with scrolling data for 'row'
-			self.scroll[row]['data'] = text # It contains text to scroll (data), position and direction
-			self.scroll[row]['position'] = 0 # Start from the beginning
-			self.scroll[row]['direction'] = 0 # Reset direction to forwards
-		
-		# Take the part of the text to currently show on the screen
-		temp = self.scroll[row]['data'][self.scroll[row]['position']:self.scroll[row]['position']+self.columns]
-		
-		# If direction is FORWARDS
-		if (self.scroll[row]['direction'] == 0):
-			# If we've reached the end, let us go backwards (change direction)
-			if (self.scroll[row]['position'] == (len(self.scroll[row]['data']) - self.columns)):
-				self.scroll[row]['direction'] = 1 # Set direction to backwards
-			else:
-				self.scroll[row]['position'] = self.scroll[row]['position'] + 1 # Move to next position
-				
-		# If direction is BACKWARDS
-		if (self.scroll[row]['direction'] == 1):
-			# If we've reached the beginning, let us go forwards (change direction)
-			if (self.scroll[row]['position'] == 0):
-				self.scroll[row]['direction'] = 0 # Set direction to forwards
-			else:
-				self.scroll[row]['position'] = self.scroll[row]['position'] - 1 # Move to next position
-				
+		if (scroll['data'] != text):
+			scroll['data'] = text
+			scroll['frames'] = self.scroll_frames(text, self.columns)
+			scroll['position'] = 0 # Start from the beginning
+			
+		# Take current frame and move to the next one
+		temp = scroll['frames'][scroll['position']]
+		scroll['position'] = (scroll['position'] + 1) % len(scroll['frames'])
+		
 		return temp
 		
 	# Function for showing volume screen
@@ -219,16 +385,11 @@ class display:
 		else:
 			skip_lines = 0
 		
-		# Load custom characters if needed
-		if (self.current_custom_chars != 1):
-			self.lcd_load_custom_chars(speaker_icon)
-			self.current_custom_chars = 1
-		
 		# Show first part of icon + "volume"
-		self.display_data[skip_lines] = chr(0) + chr(1) + ' Volume'
+		self.display_data[skip_lines] = self.glyph(speaker_icon[0]) + self.glyph(speaker_icon[1]) + ' Volume'
 		
 		# Show second part of icon
-		self.display_data[skip_lines + 1] = chr(2) + chr(3) + ' '
+		self.display_data[skip_lines + 1] = self.glyph(speaker_icon[2]) + self.glyph(speaker_icon[3]) + ' '
 		
 		# If volume is 0 or 100 ...
 		if (self.volume_value == 0 or self.volume_value == 100):
@@ -283,11 +444,7 @@ class display:
 				self.display_data[3] += ' '
 			
 		# At the end, update the display
-		while (self.lock_display):
-			pass
-		self.lock_display = True
 		self.update_display()
-		self.lock_display = False
 		
 	# Function for showing shuffle (0), repeat all (1) or repeat single (2) screen
 	def show_play_mode(self):		
@@ -330,16 +487,11 @@ class display:
 			icon = repeat_single_icon
 			text = "Repeat One"
 		
-		# Load custom characters if needed
-		if (self.current_custom_chars != (self.play_mode_type + 2)):
-			self.lcd_load_custom_chars(icon)
-			self.current_custom_chars = (self.play_mode_type + 2)
-		
 		# Show first part of icon
-		self.display_data[skip_lines] = chr(0) + chr(1)
+		self.display_data[skip_lines] = self.glyph(icon[0]) + self.glyph(icon[1])
 		
 		# Show second part of icon
-		self.display_data[skip_lines + 1] = chr(2) + chr(3)
+		self.display_data[skip_lines + 1] = self.glyph(icon[2]) + self.glyph(icon[3])
 		
 		# We need to center the text so we have to calculate how much spaces depending on screen width
 		temp = self.columns - 2 - len(text) # 2 (for icon) and length of text
@@ -398,17 +550,75 @@ class display:
 				self.display_data[3] += ' '
 			
 		# At the end, update the display
-		while (self.lock_display):
-			pass
-		self.lock_display = True
 		self.update_display()
-		self.lock_display = False
+		
+	# Function for showing connecting screen, while connection to MPD is lost
+	def show_connecting(self):
+		# If display is 4x20, this will be displayed in lines 2 and 3, otherwise 1 and 2 (2x16)
+		if (self.rows >= 4):
+			skip_lines = 1
+		else:
+			skip_lines = 0
+			
+		# Clear all rows
+		for i in range(self.rows):
+			self.display_data[i] = ' ' * self.columns
+			
+		# Power icon and centered text
+		self.display_data[skip_lines] = self.glyph(self.display_icons[6]) + 'Connecting to MPD'[:self.columns - 1].center(self.columns - 1)
+		self.display_data[skip_lines + 1] = 'Please wait...'.center(self.columns)
+		
+		# At the end, update the display
+		self.update_display()
+		
+	# Wake up display thread, flags it has to check must be set before
+	def notify(self):
+		os.write(self.wake_write, 'x')
+			
+	# Set deadline with given name, after delay seconds
+	def schedule(self, name, delay):
+		when = monotonic() + delay
+		self.timers[name] = when
+		heapq.heappush(self.deadlines, (when, name))
+		
+	# Remove deadline with given name
+	def cancel(self, name):
+		self.timers.pop(name, None)
+		
+	# Return time until the next deadline or None if there isn't any
+	def next_deadline(self):
+		while self.deadlines:
+			when, name = self.deadlines[0]
+			
+			# Skip cancelled and rescheduled deadlines
+			if (self.timers.get(name) != when):
+				heapq.heappop(self.deadlines)
+				continue
+			
+			return max(when - monotonic(), 0)
+			
+		return None
+		
+	# Remove and return names of all deadlines which have passed
+	def pop_deadlines(self):
+		due = []
+		now = monotonic()
+		
+		while (self.deadlines and self.deadlines[0][0] <= now):
+			when, name = heapq.heappop(self.deadlines)
+			
+			if (self.timers.get(name) == when):
+				del self.timers[name]
+				due.append(name)
+				
+		return due
 		
 	# This function is called by MPD when volume is changed
 	def volume_changed(self, value):
 		# We only have to notify the display thread
 		self.volume_value = value
 		self.volume_screen = True
+		self.notify()
 		
 	# This function is called by MPD when play mode is changed
 	def play_mode_changed(self, type, state):
@@ -416,14 +626,24 @@ class display:
 		self.play_mode_type = type
 		self.play_mode_state = state
 		self.play_mode_screen = True
+		self.notify()
 		
 	# This function is called by MPD when data changes (for example, song)
+	# What exactly changed is found out from MPD data snapshots (player_state.changesFrom)
 	def data_change(self):
 		self.data_changed = True
+		self.notify()
 	
-	# This function is called by MPD when time changes (for example, second passed in elapsed time)
-	def time_change(self):
-		self.time_changed = True
+	# This function is called by MPD when connection is lost (False) or made again (True)
+	def connection_changed(self, connected):
+		self.mpd_connected = connected
+		self.connection_change = True
+		self.notify()
+			
+	# This function is called by network monitor when IP address appears or disappears
+	def network_change(self):
+		self.network_changed = True
+		self.notify()
 		
 	# This function is called by remote or button to change screen mode
 	def change_screen(self):
@@ -436,6 +656,14 @@ class display:
 		# If we reached the end, let's go from beginning
 		if (self.screen >= self.screens):
 			self.screen = 0
+			
+		self.screen_changed = True
+		self.notify()
+		
+	# Return time until given counter (in seconds) reaches the next whole second
+	# A millisecond is added so that we surely wake up after it
+	def next_second(self, seconds):
+		return 1 - math.modf(seconds)[0] + 0.001
 		
 	# Convert seconds to M:S (type = 0), H:M:S (type = 1) or D:H:M:S (type = 2)
 	def convert_time(self, seconds, type):
@@ -487,36 +715,16 @@ class display:
 			
 		return temp
 		
-	# Get IP addresses to show on screen: ifname = eth0 | ifname = elan0
-	def get_ip_address(self, ifname):
-		s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-		try:
-			return socket.inet_ntoa(fcntl.ioctl(
-				s.fileno(),
-				0x8915,  # SIOCGIFADDR
-				struct.pack('256s', ifname)
-			)[20:24])
-		except IOError:
-			return ''
-			
-	# Return CPU temperature as a character string                                      
+	# Return CPU temperature as a character string
 	def getCPUtemperature(self):
-		res = os.popen('/opt/vc/bin/vcgencmd measure_temp').readline()
-		return(res.replace("temp=","").replace("'C\n",""))
+		return self.metrics.get_temperature()
 		
-	# Return RAM information (unit=kb) in a list                                        
+	# Return RAM information in a list of strings, in MB (system metrics give it in kB, from /proc/meminfo)
 	# Index 0: total RAM                                                                
 	# Index 1: used RAM                                                                 
 	# Index 2: free RAM                                                                 
 	def getRAMinfo(self):
-		p = os.popen('free')
-		i = 0
-		while 1:
-			i = i + 1
-			line = p.readline()
-			if i==2:
-				data = line.split()[1:4]
-				break
+		data = self.metrics.get_ram()
 				
 		# For 16x2 LCD, remove decimal value (to fit on the screen)
 		if (self.columns < 20):
@@ -527,33 +735,15 @@ class display:
 				
 		# Convert it to MB and show as xy.z		
 		temp = []
-		temp.append(display_format.format(int(data[0]) / 1024.0))
-		temp.append(display_format.format(int(data[1]) / 1024.0))
-		temp.append(display_format.format(int(data[2]) / 1024.0))	
+		temp.append(display_format.format(data[0] / 1024.0))
+		temp.append(display_format.format(data[1] / 1024.0))
+		temp.append(display_format.format(data[2] / 1024.0))	
 		
 		return temp
 		
 	# Return date and time
 	def get_datetime(self):
-		p = os.popen('date')
-		line = p.readline().strip()
-		data = line.split()
-		
-		# Get clock
-		try:
-			clock = data[3]
-		except KeyError:
-			clock = ''
-			
-		print data
-		
-		# Get date
-		try:
-			date = data[2] + ' ' + data[1] + ' ' + data[5]
-		except KeyError:
-			date = ''
-		
-		return { 'clock': clock, 'date': date }		
+		return self.metrics.get_datetime()
 			
 	# Screen 0 shows artist and song name, times and track info
 	# Returns whether the data has changed or not
@@ -561,10 +751,7 @@ class display:
 		data_changed = False
 	
 		# FIRST ROW: Get artist data from MPD and pass it to scroll function
-		try:
-			temp = self.scroll_row(0, self.mpd.getData()['artist'])
-		except KeyError:
-			temp = ''
+		temp = self.scroll_row(0, self.state.artist)
 		
 		# Check if data has changed
 		if (temp != self.display_data[0]):
@@ -572,26 +759,29 @@ class display:
 			data_changed = True
 		
 		# SECOND ROW: Get song name data from MPD and pass it to scroll function
-		try:
-			temp = self.scroll_row(1, self.mpd.getData()['title'])
-		except KeyError:
-			temp = ''
+		temp = self.scroll_row(1, self.state.title)
 		
 		# Check if data has changed
 		if (temp != self.display_data[1]):
 			self.display_data[1] = temp
 			data_changed = True
 			
-		self.wait_time = self.scroll_period
+		# Only if some row is scrolling, it has to be refreshed with scrolling period
+		if (len(self.scroll[0]['frames']) > 1 or len(self.scroll[1]['frames']) > 1):
+			self.wait_time = self.scroll_period
 			
 		return data_changed
 		
-	# This screen shows time and track/station info
+	# This screen shows time and track/station info, it has two regions:
+	# time with state icon (screen_1_time) and track/station info (screen_1_info)
 	# Returns whether the data has changed or not
-	def screen_1(self):
+	def screen_1_time(self):
 		data_changed = False		
 		temp = ''
 		
+		# Elapsed time is calculated from the last value fetched from MPD
+		elapsed = self.state.getElapsed()
+		
 		# If display is 4x20, this will be displayed in lines 3 and 4, otherwise 1 and 2 (2x16)
 		if (self.rows >= 4):
 			skip_lines = 2
@@ -599,15 +789,15 @@ class display:
 			skip_lines = 0
 			
 		# If file is playing
-		if (self.mpd.getData()['type'] == 0):
+		if (self.state.type == 0):
 			# Get elapsed time
-			elapsed_time = self.convert_time(self.mpd.getData()['elapsed_time'], 0)
+			elapsed_time = self.convert_time(int(elapsed), 0)
 			
 			# Get total track time
-			total_time = self.convert_time(self.mpd.getData()['total_time'], 0)
+			total_time = self.convert_time(self.state.total_time, 0)
 			
 			# Get state icon
-			icon = chr(self.mpd.getData()['state'])
+			icon = self.glyph(self.display_icons[self.state.state])
 			
 			temp = ''
 			
@@ -638,12 +828,12 @@ class display:
 			temp += total_time
 			
 		# else if radio is playing
-		elif (self.mpd.getData()['type'] == 1):		
+		elif (self.state.type == 1):		
 			# Get elapsed time
-			elapsed_time = self.convert_time(self.mpd.getData()['elapsed_time'], 1)
+			elapsed_time = self.convert_time(int(elapsed), 1)
 			
 			# Get state icon
-			icon = chr(self.mpd.getData()['state'])
+			icon = self.glyph(self.display_icons[self.state.state])
 			
 			temp = ''
 			
@@ -680,19 +870,34 @@ class display:
 			temp += word
 			
 		# Check if data has changed
-		if (temp != self.display_data[skip_lines]):
+		if (temp != self.display_data[skip_lines + 1]):
 			self.display_data[skip_lines + 1] = temp
 			data_changed = True
 			
-		# Last line shows RADIO/FILE and bitrate
-		if (self.mpd.getData()['type'] == 0):
+		# While playing, refresh it when the next second of the track starts
+		if (self.state.state == 1):
+			self.wait_time = self.next_second(elapsed)
+			
+		return data_changed
+		
+	def screen_1_info(self):
+		data_changed = False
+		
+		# If display is 4x20, this will be displayed in line 3, otherwise 1 (2x16)
+		if (self.rows >= 4):
+			skip_lines = 2
+		else:
+			skip_lines = 0
+			
+		# First line shows RADIO/FILE and bitrate
+		if (self.state.type == 0):
 			word = "FILE"
 			
-		elif (self.mpd.getData()['type'] == 1):
+		elif (self.state.type == 1):
 			word = "RADIO"
 		
 		# Get bitrate
-		bitrate = `self.mpd.getData()['bitrate']` + ' kbps'
+		bitrate = `self.state.bitrate` + ' kbps'
 		
 		# Show type
 		temp = word
@@ -705,75 +910,58 @@ class display:
 		temp += bitrate
 		
 		# Check if data has changed
-		if (temp != self.display_data[skip_lines + 1]):
+		if (temp != self.display_data[skip_lines]):
 			self.display_data[skip_lines] = temp
 			data_changed = True
 			
-		# If data changed, see if there's a need to load custom charachters
-		if (data_changed):
-			# Load custom characters, if needed
-			if (self.current_custom_chars != 0):
-				self.lcd_load_custom_chars(self.display_icons)
-				self.current_custom_chars = 0
-		
 		return data_changed
 		
-	# This screen shows Ethernet and Wi-Fi IP address, if connected
+	# This screen shows IP addresses of all connected interfaces (as much as fits)
+	# It's refreshed when network monitor notices a change
 	def screen_2(self):
 		data_changed = False
-		temp = ''
-		
-		# Get Ethernet IP
-		ethip = self.get_ip_address('eth0')
-		
-		# If there's no IP address
-		if (ethip == ''):
-			ethip = 'Not connected'
-			
-		# Check if we will show the icon or not
-		if ((len(ethip) + 2) > self.columns):
-			temp = ethip
-		
-		# Else show icon as well
-		else:
-			temp = chr(3) + ' ' + ethip
-			
-		# Will remaining space with ' '
-		for i in range(self.columns - len(temp)):
-			temp += ' '
-			
-		# Check if data changed
-		if (temp != self.display_data[0]):
-			self.display_data[0] = temp
-			data_changed = True
-			
-		temp = ''
-			
-		# Get Wireless IP
-		wifiip = self.get_ip_address('wlan0')
 		
+		# Take Ethernet icon for wired, Wi-Fi icon for wireless interfaces
+		lines = []
+		for ifname, family, address in self.network.get_addresses():
+			if self.network.is_wireless(ifname):
+				lines.append((self.display_icons[4], address))
+			else:
+				lines.append((self.display_icons[3], address))
+				
 		# If there's no IP address
-		if (wifiip == ''):
-			wifiip = 'Not connected'
+		if not lines:
+			lines.append((self.display_icons[3], 'Not connected'))
 			
-		# Check if we will show the icon or not
-		if ((len(wifiip) + 2) > self.columns):
-			temp = wifiip
+		scrolling = False
 		
-		# Else show icon as well
-		else:
-			temp = chr(4) + ' ' + wifiip
-			
-		# Will remaining space with ' '
-		for i in range(self.columns - len(temp)):
-			temp += ' '
-			
-		# Check if data changed
-		if (temp != self.display_data[1]):
-			self.display_data[1] = temp
-			data_changed = True
-			
-		self.wait_time = 1000 / self.period
+		for row in range(2):
+			if (row < len(lines)):
+				icon, address = lines[row]
+				
+				# Check if we will show the icon or not, long (IPv6) address will be scrolled
+				if ((len(address) + 2) > self.columns):
+					temp = self.scroll_row(row, address)
+					scrolling = scrolling or (len(address) > self.columns)
+				
+				# Else show icon as well
+				else:
+					temp = self.glyph(icon) + ' ' + address
+					
+			else:
+				temp = ''
+				
+			# Will remaining space with ' '
+			temp = temp.ljust(self.columns)
+				
+			# Check if data changed
+			if (temp != self.display_data[row]):
+				self.display_data[row] = temp
+				data_changed = True
+				
+		# Long addresses are scrolling
+		if scrolling:
+			self.wait_time = self.scroll_period
 			
 		return data_changed
 		
@@ -789,8 +977,17 @@ class display:
 		else:
 			skip_lines = 0
 		
+		# Both are calculated from the last values fetched from MPD
+		playtime_value = self.state.getPlaytime()
+		uptime_value = self.state.getUptime()
+		
+		# Refresh it when the next second of uptime (or playtime, while playing) starts
+		self.wait_time = self.next_second(uptime_value)
+		if (self.state.state == 1):
+			self.wait_time = min(self.wait_time, self.next_second(playtime_value))
+		
 		# Get playtime from last reboot
-		playtime = self.convert_time(self.mpd.getData()['playtime'], 2)
+		playtime = self.convert_time(int(playtime_value), 2)
 		
 		# If there's enough space for it, convert 'd' to 'days', 3 for 'ays', 2 for icon and space
 		if ((len(playtime) + 3 + 2) <= self.columns):
@@ -798,7 +995,7 @@ class display:
 			
 		# Check if there's enough space for showing icon, and add it if it's possible
 		if ((len(playtime) + 2) <= self.columns):
-			playtime = chr(5) + ' ' + playtime
+			playtime = self.glyph(self.display_icons[5]) + ' ' + playtime
 			
 		# Fill empty space with ' '
 		for i in range(self.columns - len(playtime)):
@@ -810,7 +1007,7 @@ class display:
 			data_changed = True
 			
 		# Get uptime from last reboot
-		uptime = self.convert_time(self.mpd.getData()['uptime'], 2)
+		uptime = self.convert_time(int(uptime_value), 2)
 		
 		# If there's enough space for it, convert 'd' to 'days', 3 for 'ays', 2 for icon and space
 		if ((len(uptime) + 3 + 2) <= self.columns):
@@ -818,7 +1015,7 @@ class display:
 			
 		# Check if there's enough space for showing icon, and add it if it's possible
 		if ((len(uptime) + 2) <= self.columns):
-			uptime = chr(6) + ' ' + uptime
+			uptime = self.glyph(self.display_icons[6]) + ' ' + uptime
 			
 		# Fill empty space with ' '
 		for i in range(self.columns - len(uptime)):
@@ -829,15 +1026,6 @@ class display:
 			self.display_data[skip_lines + 1] = uptime
 			data_changed = True
 			
-		# If data changed, see if there's a need to load custom charachters
-		if (data_changed):
-			# Load custom characters, if needed
-			if (self.current_custom_chars != 0):
-				self.lcd_load_custom_chars(self.display_icons)
-				self.current_custom_chars = 0
-				
-		self.wait_time = 1000 / self.period
-				
 		return data_changed
 		
 	# Show clock and date
@@ -884,7 +1072,8 @@ class display:
 			self.display_data[1] = temp
 			data_changed = True
 			
-		self.wait_time = 1000 / self.period
+		# Refresh it on the next second of the clock
+		self.wait_time = self.next_second(time.time())
 			
 		return data_changed
 		
@@ -944,132 +1133,149 @@ class display:
 			self.display_data[skip_lines + 1] = temp
 			data_changed = True
 			
-		self.wait_time = 1000 / self.period
+		self.wait_time = self.system_period
 		
 		return data_changed
 			
+	# Refresh regions of current screen(s) which are due, returns whether the data has changed or not
+	# Everything is refreshed if full is True, otherwise only regions which depend on
+	# one of the events or whose deadline has passed (due)
+	def refresh_screen(self, full, events, due):
+		data_changed = False
+		
+		# For 4x20 display, two screens are shown at once
+		if (self.rows >= 4):
+			screens = [self.screen, self.screen + 1]
+		else:
+			screens = [self.screen]
+			
+		for screen in screens:
+			for name, function, depends in self.screen_regions[screen]:
+				if (not full and name not in due and not events.intersection(depends)):
+					continue
+					
+				self.wait_time = None
+				if function():
+					data_changed = True
+				
+				# Schedule next refresh of this region, if it needs it
+				if (self.wait_time != None):
+					self.schedule(name, self.wait_time)
+				else:
+					self.cancel(name)
+		
+		return data_changed
+		
+	# Remove deadlines of all regions (for example, when screen changes)
+	def cancel_regions(self):
+		for regions in self.screen_regions:
+			for region in regions:
+				self.cancel(region[0])
+		
 	# Main function which is running all the time to update display
+	# It sleeps until something is changed or until the next deadline (region refresh, temporary screen)
 	def main_function(self):
 		while True:
-			# Set period for checking for changes
-			time.sleep(self.period)
+			# Wait for notification or deadline
+			# Pipe is drained before flags are checked, so notification which comes later wakes us up again
+			while True:
+				due = self.pop_deadlines()
+				
+				if (due or self.volume_screen or self.play_mode_screen or self.data_changed or self.network_changed or self.screen_changed or self.connection_change):
+					break
+					
+				if select.select([self.wake_read], [], [], self.next_deadline())[0]:
+					os.read(self.wake_read, 4096)
+					
+			# Regions which depend on these notifications will be refreshed
+			events = set()
+			
+			# Take one snapshot of MPD data for the whole frame; if its version is the same
+			# as the last one, MPD data didn't change and nothing has to be recomputed because of it
+			state = self.mpd.getData()
+			if (state.version != self.state.version):
+				events = state.changesFrom(self.state)
+				self.state = state
+				
+			# Whole screen has to be refreshed (screen changed, temporary screen passed)
+			full = False
+			
+			# Temporary screen passed
+			if ('temporary' in due):
+				self.temporary_screen = False
+				full = True
 			
 			# Check if volume is set
 			if (self.volume_screen):
 				self.volume_screen = False
 				self.show_volume()
-				self.wait_time = self.temporary_screen_period
 				self.temporary_screen = True
+				self.schedule('temporary', self.temporary_screen_period)
 				
 			# Check if play mode is set
 			if (self.play_mode_screen):
 				self.play_mode_screen = False
 				self.show_play_mode()
-				self.wait_time = self.temporary_screen_period
 				self.temporary_screen = True
+				self.schedule('temporary', self.temporary_screen_period)
 				
-			# Check if data changed - time to update display
+			# Check if data changed - time to update display (even if temporary screen is shown)
 			if (self.data_changed):
 				self.data_changed = False
-				self.wait_time = 0 # Skip waiting
 				
-			# Check if time has changed
-			if (self.time_changed):
-				self.time_changed = False
+				if self.temporary_screen:
+					self.temporary_screen = False
+					self.cancel('temporary')
+					full = True
 				
-				# If there's a temporary screen (volume), we don't want to interrupt it by clock
-				if (self.temporary_screen == False):
-					self.wait_time = 0
-			
-			# Check if there's a wait time to pass
-			if (self.wait_time > 0):
-				self.wait_time -= 1
-				continue
-			
-			# Temporary screen passed
-			self.temporary_screen = False
-			
-			data_changed = False
-			
-			# If screen 0 is selected
-			if (self.screen == 0):
-				# If display is 4x20
-				if (self.rows >= 4):
-					data_changed1 = self.screen_0()
-					data_changed2 = self.screen_1()
-					data_changed = data_changed1 or data_changed2
-					
-				# Else it's a 2x16
-				else:
-					data_changed = self.screen_0()
-					
-			# Else if screen is 1
-			elif (self.screen == 1):
-				# 1 is only for 2x16 display
-				if (self.rows < 4):
-					data_changed = self.screen_1()
-					
-				# Else return to screen 0
-				else:
-					self.screen == 0
-					
-			# Else if screen is 2
-			elif (self.screen == 2):
-				# If display is 4x20
-				if (self.rows >= 4):
-					data_changed1 = self.screen_2()
-					data_changed2 = self.screen_3()
-					data_changed = data_changed1 or data_changed2
-					
-				# Else it's a 2x16
-				else:
-					data_changed = self.screen_2()
-					
-			# Else if screen is 3
-			elif (self.screen == 3):
-				# 1 is only for 2x16 display
-				if (self.rows < 4):
-					data_changed = self.screen_3()
-					
-				# Else return to screen 2
-				else:
-					self.screen == 2
-					
-			# Else if screen is 4
-			elif (self.screen == 4):
-				# If display is 4x20
-				if (self.rows >= 4):
-					data_changed1 = self.screen_4()
-					data_changed2 = self.screen_5()
-					data_changed = data_changed1 or data_changed2
-					
-				# Else it's a 2x16
+			# Check if IP address has changed
+			if (self.network_changed):
+				self.network_changed = False
+				events.add('network')
+				
+			# Check if screen has changed
+			if (self.screen_changed):
+				self.screen_changed = False
+				full = True
+				
+			# Check if MPD connection is lost or made again
+			if (self.connection_change):
+				self.connection_change = False
+				
+				if self.mpd_connected:
+					full = True
 				else:
-					data_changed = self.screen_4()
-					
-			# Else if screen is 5
-			elif (self.screen == 5):
-				# 1 is only for 2x16 display
-				if (self.rows < 4):
-					data_changed = self.screen_5()
+					self.temporary_screen = False
+					self.cancel('temporary')
+					self.show_connecting()
 					
-				# Else return to screen 4
-				else:
-					self.screen == 4
-			
-			# If data has changed, update display
-			if (data_changed):					
-				while (self.lock_display):
-					continue
+			# While MPD isn't connected, connecting screen stays on the display
+			if not self.mpd_connected:
+				self.cancel_regions()
+				continue
 				
-				self.lock_display = True
-				self.update_display()
-				self.lock_display = False
+			# If there's a temporary screen (volume), we don't want to interrupt it
+			# Regions will be refreshed (and scheduled again) when it passes
+			if self.temporary_screen:
+				self.cancel_regions()
+				continue
 				
-				data_changed = False
+			# Regions of the previous screen don't need their deadlines anymore
+			if full:
+				self.cancel_regions()
+				
+			# If data has changed, update display
+			if self.refresh_screen(full, events, due):
+				self.update_display()
 				
 	# Function for starting display thread
 	def start(self):
+		self.network.start()
+		
+		self.writer_t = threading.Thread(target=self.writer.run, args = ()) # Create thread for writing to LCD
+		self.writer_t.daemon = True
+		self.writer_t.start()
+		
 		self.lcd_t = threading.Thread(target=self.main_function, args = ()) # Create thread for updating LCD
 		self.lcd_t.daemon = True # Yep, it's a daemon, when main thread finish, this one will finish too
 		self.lcd_t.start() # Start it!
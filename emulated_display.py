@@ -0,0 +1,279 @@
+''' EMULATED_DISPLAY - Inherits i2c_display class from i2c_display.py '''
+
+# This display doesn't need any hardware: it emulates PCF8574 I2C expander and HD44780
+# LCD controller in memory, so every screen can be tested and profiled on any computer
+# It uses the same code path as I2C display, only bytes end up here instead of on a bus
+
+import i2c_display, collections
+from i2c_display import En, Rs, LCD_BACKLIGHT, I2C_BLOCK_SIZE
+
+# Length of one DDRAM line (in 2-line mode)
+DDRAM_LINE = 40
+
+# This class emulates PCF8574 + HD44780 and has the same methods as i2c_device
+class hd44780_emulator:
+	# Initialize emulator; combined = True emulates smbus2 (whole stream in one transaction)
+	def __init__(self, combined=False):
+		self.combined = combined
+
+		# Counters, transactions and bytes sent over the bus
+		self.transactions = 0
+		self.bytes = 0
+
+		# Last byte written to expander port
+		self.port = 0
+		self.backlight = False
+
+		# After power up, controller is in 8-bit mode; in 4-bit mode we wait for second nibble
+		self.eight_bit = True
+		self.nibble = None
+		self.two_lines = False
+
+		# Memory: DDRAM is filled with spaces, CGRAM with zeros
+		self.ddram = [0x20] * 0x80
+		self.cgram = [0] * 0x40
+
+		# Address counter and which memory it points to
+		self.address = 0
+		self.cgram_selected = False
+
+		# Entry mode (increment and display shift) and how much display is shifted to the left
+		self.increment = True
+		self.shift = False
+		self.offset = 0
+
+		# Display on/off control
+		self.display_on = False
+		self.cursor = False
+		self.blink = False
+
+	''' METHODS FROM I2C_DEVICE '''
+	def write_cmd(self, cmd):
+		self.transactions += 1
+		self.write_port(cmd)
+
+	def write_cmd_arg(self, cmd, data):
+		self.transactions += 1
+		self.write_port(cmd)
+		self.write_port(data)
+
+	def write_block_data(self, cmd, data):
+		self.transactions += 1
+		self.write_port(cmd)
+		for byte in data:
+			self.write_port(byte)
+
+	def write_bytes(self, data):
+		# Count transactions the same way as i2c_device does
+		if self.combined:
+			self.transactions += 1
+		else:
+			self.transactions += (len(data) + I2C_BLOCK_SIZE - 1) / I2C_BLOCK_SIZE
+
+		for byte in data:
+			self.write_port(byte)
+
+	''' PCF8574 '''
+	# Every byte is written to the port; controller latches data on falling edge of En
+	def write_port(self, byte):
+		self.bytes += 1
+		self.backlight = (byte & LCD_BACKLIGHT) != 0
+
+		if ((self.port & En) and not (byte & En)):
+			self.latch(byte)
+
+		self.port = byte
+
+	''' HD44780 '''
+	# Take upper four bits from the port
+	def latch(self, byte):
+		nibble = byte >> 4
+
+		# In 8-bit mode, lower four bits are not connected (they are zero)
+		if self.eight_bit:
+			self.execute(nibble << 4, byte & Rs)
+
+		# In 4-bit mode, we need two nibbles, high one first
+		elif (self.nibble == None):
+			self.nibble = nibble
+
+		else:
+			value = (self.nibble << 4) | nibble
+			self.nibble = None
+			self.execute(value, byte & Rs)
+
+	# Execute instruction (rs = 0) or write data (rs = 1)
+	def execute(self, value, rs):
+		if rs:
+			self.write_data(value)
+
+		# Set DDRAM address
+		elif (value & 0x80):
+			self.address = value & 0x7F
+			self.cgram_selected = False
+
+		# Set CGRAM address
+		elif (value & 0x40):
+			self.address = value & 0x3F
+			self.cgram_selected = True
+
+		# Function set
+		elif (value & 0x20):
+			self.eight_bit = (value & 0x10) != 0
+			self.two_lines = (value & 0x08) != 0
+			self.nibble = None
+
+		# Cursor or display shift
+		elif (value & 0x10):
+			if (value & 0x08):
+				if (value & 0x04):
+					self.offset -= 1
+				else:
+					self.offset += 1
+			else:
+				self.move_address(value & 0x04)
+
+		# Display on/off control
+		elif (value & 0x08):
+			self.display_on = (value & 0x04) != 0
+			self.cursor = (value & 0x02) != 0
+			self.blink = (value & 0x01) != 0
+
+		# Entry mode set
+		elif (value & 0x04):
+			self.increment = (value & 0x02) != 0
+			self.shift = (value & 0x01) != 0
+
+		# Return home
+		elif (value & 0x02):
+			self.address = 0
+			self.offset = 0
+			self.cgram_selected = False
+
+		# Clear display
+		elif (value & 0x01):
+			self.ddram = [0x20] * 0x80
+			self.address = 0
+			self.offset = 0
+			self.increment = True
+			self.cgram_selected = False
+
+	# Write data to DDRAM or CGRAM and move address counter
+	def write_data(self, value):
+		if self.cgram_selected:
+			self.cgram[self.address] = value
+
+			if self.increment:
+				self.address = (self.address + 1) & 0x3F
+			else:
+				self.address = (self.address - 1) & 0x3F
+
+			return
+
+		self.ddram[self.address] = value
+		self.move_address(self.increment)
+
+		# Display follows the cursor, if it's enabled in entry mode
+		if self.shift:
+			if self.increment:
+				self.offset += 1
+			else:
+				self.offset -= 1
+
+	# Move DDRAM address forward or backward, lines are 0x00 - 0x27 and 0x40 - 0x67
+	def move_address(self, forward):
+		if (not self.two_lines):
+			if forward:
+				self.address = (self.address + 1) % 0x50
+			else:
+				self.address = (self.address - 1) % 0x50
+
+		elif forward:
+			if (self.address == 0x27):
+				self.address = 0x40
+			elif (self.address >= 0x67):
+				self.address = 0
+			else:
+				self.address += 1
+
+		else:
+			if (self.address == 0x40):
+				self.address = 0x27
+			elif (self.address == 0):
+				self.address = 0x67
+			else:
+				self.address -= 1
+
+	# Return what is visible on the screen, list of strings (one for each row)
+	# Custom characters are returned as chr(0) - chr(7)
+	def grid(self, rows, columns):
+		screen = []
+
+		for row in range(rows):
+			start = i2c_display.LCD_LINES[row] & 0x7F
+			line = start & 0x40 # Start of DDRAM line (0x00 or 0x40)
+
+			temp = ''
+			for column in range(columns):
+				position = ((start - line) + column + self.offset) % DDRAM_LINE
+				temp += chr(self.ddram[line + position])
+
+			screen.append(temp)
+
+		return screen
+
+class emulated_display(i2c_display.i2c_display):
+	# Use emulator instead of the I2C device
+	''' OVERRIDED FROM I2C_DISPLAY '''
+	def lcd_open_device(self):
+		# Bus transactions and bytes for each written frame (only last 1000 are kept)
+		self.frame_stats = collections.deque(maxlen=1000)
+
+		# Glyph uploads and backlight changes since the last frame, they are counted to the next one
+		self.pending = {'transactions': 0, 'bytes': 0}
+
+		return hd44780_emulator()
+
+	# Call method of I2C display and add its bus transactions and bytes to pending ones
+	def counted(self, method, *args):
+		transactions = self.lcd_device.transactions
+		sent = self.lcd_device.bytes
+
+		method(self, *args)
+
+		self.pending['transactions'] += self.lcd_device.transactions - transactions
+		self.pending['bytes'] += self.lcd_device.bytes - sent
+
+	# Upload custom character, it belongs to the next frame
+	''' OVERRIDED FROM DISPLAY '''
+	def lcd_load_custom_char(self, slot, fontdata):
+		self.counted(i2c_display.i2c_display.lcd_load_custom_char, slot, fontdata)
+
+	# Toggle backlight, it belongs to the next frame too
+	''' OVERRIDED FROM DISPLAY '''
+	def lcd_backlight(self, state):
+		self.counted(i2c_display.i2c_display.lcd_backlight, state)
+
+	# Write message and remember how much did it cost, with everything sent since the last frame
+	''' OVERRIDED FROM DISPLAY '''
+	def lcd_message(self, text):
+		self.counted(i2c_display.i2c_display.lcd_message, text)
+
+		self.frame_stats.append(self.pending)
+		self.pending = {'transactions': 0, 'bytes': 0}
+
+	# Return characters which are currently visible, one string per row
+	def get_screen(self):
+		return self.lcd_device.grid(self.rows, self.columns)
+
+	# Return CGRAM contents, 8 custom characters with 8 lines each
+	def get_cgram(self):
+		cgram = []
+		for i in range(8):
+			cgram.append(self.lcd_device.cgram[i * 8:(i + 1) * 8])
+
+		return cgram
+
+	# Return backlight state, as seen on the expander port
+	def get_backlight(self):
+		return self.lcd_device.backlight
@@ -0,0 +1,111 @@
+import threading, collections
+
+# Events published by MPD client, with arguments handlers receive
+VOLUME_CHANGED = 'volume_changed' # volume (0 - 100)
+PLAY_MODE_CHANGED = 'play_mode_changed' # type (shuffle - 0, repeat all - 1, repeat single - 2), state (True/False)
+DATA_CHANGED = 'data_changed' # no arguments, snapshot (mpd_client.getData) tells what changed
+CONNECTION_CHANGED = 'connection_changed' # True - connected, False - connection lost
+
+# Default number of events waiting for one subscriber
+QUEUE_SIZE = 64
+
+# One subscriber of the bus, it has its own queue and thread which calls its handlers
+# Publisher only puts events into the queue, so slow subscriber can't stall it
+class subscriber:
+	# Initialize subscriber, handlers is a dictionary with event => function format
+	def __init__(self, name, handlers, size):
+		self.name = name
+		self.handlers = handlers
+
+		# Events waiting for delivery, (event, arguments)
+		self.queue = collections.deque()
+		self.size = size
+		self.ready = threading.Condition()
+
+		# Counters: delivered events, dropped ones (queue was full) and failed handlers
+		self.delivered = 0
+		self.dropped = 0
+		self.failed = 0
+
+	# Put event into the queue, it never blocks
+	# If queue is full, the oldest event is dropped (newer one tells more about current state)
+	def put(self, event, args):
+		with self.ready:
+			if (len(self.queue) >= self.size):
+				self.queue.popleft()
+				self.dropped += 1
+
+			self.queue.append((event, args))
+			self.ready.notify()
+
+	# Delivery thread, it calls handlers for events one by one
+	def run(self):
+		while True:
+			with self.ready:
+				while not self.queue:
+					self.ready.wait()
+
+				event, args = self.queue.popleft()
+
+			# Error in one handler shouldn't stop delivering next events
+			try:
+				self.handlers[event](*args)
+				self.delivered += 1
+			except Exception as e:
+				self.failed += 1
+				print('Event ' + event + ' failed in ' + self.name + ': ' + str(e))
+
+	# Start delivery thread
+	def start(self):
+		self.subscriber_t = threading.Thread(target=self.run, args = ()) # Create thread for delivering events
+		self.subscriber_t.daemon = True # Yep, it's a daemon, when main thread finish, this one will finish too
+		self.subscriber_t.start() # Start it!
+
+# Instance of this class delivers published events to everyone who subscribed to them
+class event_bus:
+	# Class constructor
+	def __init__(self):
+		self.subscribers = []
+		self.lock = threading.Lock()
+
+	# Subscribe to events, handlers is a dictionary with event => function format
+	# Only events which have a handler are delivered, returns subscriber
+	def subscribe(self, name, handlers, size=QUEUE_SIZE):
+		temp = subscriber(name, handlers, size)
+		temp.start()
+
+		with self.lock:
+			self.subscribers.append(temp)
+
+		return temp
+
+	# Stop delivering events to subscriber
+	def unsubscribe(self, subscriber):
+		with self.lock:
+			self.subscribers.remove(subscriber)
+
+	# Publish event with given arguments to all its subscribers
+	# It doesn't wait for them, so it's safe to call it from any thread
+	def publish(self, event, *args):
+		with self.lock:
+			subscribers = list(self.subscribers)
+
+		for temp in subscribers:
+			if (event in temp.handlers):
+				temp.put(event, args)
+
+	# Return delivery statistics for each subscriber: delivered, dropped and failed events
+	# and number of events still waiting
+	def get_stats(self):
+		stats = {}
+
+		with self.lock:
+			for temp in self.subscribers:
+				stats[temp.name] = {
+					'delivered': temp.delivered,
+					'dropped': temp.dropped,
+					'failed': temp.failed,
+					'queued': len(temp.queue)
+				}
+
+		return stats
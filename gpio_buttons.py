@@ -0,0 +1,181 @@
+''' GPIO_BUTTONS - Inherits buttons class from buttons.py '''
+
+# Buttons read from GPIO character device (/dev/gpiochipN, Linux 5.10+), RPi.GPIO isn't needed
+# All lines are requested at once and their edges come through one file descriptor,
+# timestamped and debounced by kernel; dispatcher thread reads them in batches
+# Edges can be recorded to a file and replayed later, so it can be tested without buttons
+
+import buttons, os, struct, fcntl, errno, threading, time
+from clock import monotonic
+
+# Default GPIO chip (Raspberry Pi header)
+GPIO_CHIP = '/dev/gpiochip0'
+
+# Board pin => BCM GPIO number (line offset on gpiochip0), 40 pin header
+BOARD_TO_BCM = {
+	3: 2, 5: 3, 7: 4, 8: 14, 10: 15, 11: 17, 12: 18, 13: 27, 15: 22, 16: 23, 18: 24, 19: 10,
+	21: 9, 22: 25, 23: 11, 24: 8, 26: 7, 27: 0, 28: 1, 29: 5, 31: 6, 32: 12, 33: 13, 35: 19,
+	36: 16, 37: 26, 38: 20, 40: 21
+}
+
+# struct gpio_v2_line_request: offsets, consumer, config (flags, number of attributes, attributes),
+# number of lines, event buffer size and fd of requested lines (returned by kernel)
+LINES_MAX = 64
+ATTRIBUTES_MAX = 10
+LINE_REQUEST = struct.Struct('=64I32sQI20x240sII20xi')
+
+# struct gpio_v2_line_config_attribute with debounce period: id, debounce period (us), mask of lines
+LINE_ATTRIBUTE = struct.Struct('=I4xI4xQ')
+
+# struct gpio_v2_line_event: timestamp (ns), id (edge), offset, sequence numbers
+# Kernel timestamps edges with CLOCK_MONOTONIC, the same clock buttons use
+LINE_EVENT = struct.Struct('=QIIII24x')
+
+# _IOWR(0xB4, 0x07, struct gpio_v2_line_request)
+GPIO_V2_GET_LINE_IOCTL = 0xC0000000 | (LINE_REQUEST.size << 16) | (0xB4 << 8) | 0x07
+
+# Line flags, attribute and event ids
+FLAG_INPUT = 1 << 2
+FLAG_EDGE_RISING = 1 << 4
+FLAG_EDGE_FALLING = 1 << 5
+FLAG_BIAS_PULL_UP = 1 << 8
+ATTR_ID_DEBOUNCE = 3
+EVENT_RISING_EDGE = 1
+
+# How many events are read at once, also size of kernel event buffer
+BATCH_SIZE = 64
+
+class gpio_buttons(buttons.buttons):
+	# Class constructor
+	# Buttons pins is a dictionary with button_name=>pin_number format (board numbering), bounce time is in miliseconds
+	# Chip is path of GPIO character device, record is path of file where edges are saved (optional)
+	# Replay is path of recorded file, edges are read from it instead of the chip (optional)
+	def __init__(self, button_pins, bounce_time, chip=GPIO_CHIP, record=None, replay=None):
+		self.chip = chip
+		self.replay = replay
+		self.record = None
+
+		if (record != None):
+			self.record = open(record, 'ab')
+
+		# Line offset => board pin
+		self.pins = {}
+
+		# No replay thread currently
+		self.replay_t = False
+
+		buttons.buttons.__init__(self, button_pins, bounce_time)
+
+	# Request all button lines, returns file descriptor of the request
+	# Debounce period is in microseconds, 0 - no debouncing
+	def request_lines(self, offsets, debounce):
+		attributes = ''
+
+		if debounce:
+			attributes = LINE_ATTRIBUTE.pack(ATTR_ID_DEBOUNCE, debounce, (1 << len(offsets)) - 1)
+
+		flags = FLAG_INPUT | FLAG_EDGE_RISING | FLAG_EDGE_FALLING | FLAG_BIAS_PULL_UP
+		request = LINE_REQUEST.pack(*(offsets + [0] * (LINES_MAX - len(offsets)) +
+			['mpd_lcd', flags, len(attributes) // LINE_ATTRIBUTE.size, attributes, len(offsets), BATCH_SIZE, 0]))
+
+		chip = os.open(self.chip, os.O_RDONLY)
+		try:
+			return LINE_REQUEST.unpack(fcntl.ioctl(chip, GPIO_V2_GET_LINE_IOCTL, request))[-1]
+		finally:
+			os.close(chip) # Requested lines stay requested until their fd is closed
+
+	# Set button pins as inputs and enable edge events
+	''' OVERRIDED FROM BUTTONS '''
+	def setup_pins(self):
+		for pin in self.buttons:
+			# Power and ground pins (or numbers which aren't on the header) aren't GPIO
+			if (pin not in BOARD_TO_BCM):
+				raise ValueError('Board pin ' + str(pin) + ' is not a GPIO pin, valid pins are: ' + ', '.join(map(str, sorted(BOARD_TO_BCM))))
+
+			self.pins[BOARD_TO_BCM[pin]] = pin
+
+		# Recorded edges are written to pipe by replay thread, dispatcher reads them like from the chip
+		if (self.replay != None):
+			fd, self.replay_write = os.pipe()
+			self.event_fds.append(fd)
+			return
+
+		offsets = sorted(self.pins)
+
+		# Kernel debounces lines, so dispatcher doesn't have to wait for the level to settle
+		try:
+			fd = self.request_lines(offsets, int(self.settle_time * 1000000))
+			self.settle_time = 0
+		except IOError as e:
+			if (e.errno != errno.EINVAL):
+				raise
+
+			print('GPIO chip ' + self.chip + ' can\'t debounce lines, they are debounced by software')
+			fd = self.request_lines(offsets, 0)
+
+		self.event_fds.append(fd)
+
+	# Read batch of edges from lines (or replay pipe)
+	''' OVERRIDED FROM BUTTONS '''
+	def read_events(self, fd):
+		data = os.read(fd, LINE_EVENT.size * BATCH_SIZE)
+
+		# Replay has finished
+		if not data:
+			self.event_fds.remove(fd)
+			os.close(fd)
+			return
+
+		if (self.record != None):
+			self.record.write(data)
+			self.record.flush()
+
+		for position in range(0, len(data) - LINE_EVENT.size + 1, LINE_EVENT.size):
+			timestamp, id, offset, seqno, line_seqno = LINE_EVENT.unpack_from(data, position)
+
+			pin = self.pins.get(offset)
+			if (pin == None):
+				continue
+
+			# Buttons are pulled up, so rising edge is release
+			if (id == EVENT_RISING_EDGE):
+				level = buttons.RELEASED
+			else:
+				level = buttons.PRESSED
+
+			self.edges.append((pin, level, timestamp / 1e9))
+
+	# Replay thread, writes recorded edges with the same delays between them as they had
+	# Timestamps are moved to the current time, so dispatcher sees them as new ones
+	def replay_thread(self):
+		with open(self.replay, 'rb') as f:
+			data = f.read()
+
+		first = None
+		start = monotonic()
+
+		for position in range(0, len(data) - LINE_EVENT.size + 1, LINE_EVENT.size):
+			event = list(LINE_EVENT.unpack_from(data, position))
+
+			if (first == None):
+				first = event[0]
+
+			when = start + (event[0] - first) / 1e9
+			delay = when - monotonic()
+			if (delay > 0):
+				time.sleep(delay)
+
+			event[0] = int(when * 1e9)
+			os.write(self.replay_write, LINE_EVENT.pack(*event))
+
+		os.close(self.replay_write)
+
+	# Start dispatcher thread and replay thread (if replaying)
+	''' OVERRIDED FROM BUTTONS '''
+	def start(self):
+		buttons.buttons.start(self)
+
+		if (self.replay != None):
+			self.replay_t = threading.Thread(target=self.replay_thread, args = ()) # Create thread for replaying edges
+			self.replay_t.daemon = True # Yep, it's a daemon, when main thread finish, this one will finish too
+			self.replay_t.start() # Start it!
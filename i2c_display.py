@@ -10,9 +10,19 @@ Modified and integrated into this script by Randy Cupic (XploD)
 
 # WARNING: For all overrided methods see display.py for documentation
 
-import display, smbus
+import display
 from time import *
 
+# smbus2 can send a whole frame in one combined transaction, plain smbus only in blocks
+# Without any of them only the emulated display (emulated_display.py) can be used
+try:
+	import smbus2 as smbus
+except ImportError:
+	try:
+		import smbus
+	except ImportError:
+		smbus = None
+
 ''' COMMANDS FOR LCD DISPLAY '''
 # Commands
 LCD_CLEARDISPLAY = 0x01
@@ -61,11 +71,15 @@ LCD_LINE_1 = 0x80 # LCD RAM address for the 1st line
 LCD_LINE_2 = 0xC0 # LCD RAM address for the 2nd line
 LCD_LINE_3 = 0x94 # LCD RAM address for the 3rd line
 LCD_LINE_4 = 0xD4 # LCD RAM address for the 4th line
+LCD_LINES = [LCD_LINE_1, LCD_LINE_2, LCD_LINE_3, LCD_LINE_4] # Row number => RAM address
 
 # Flags for backlight control
 LCD_BACKLIGHT = 0x08
 LCD_NOBACKLIGHT = 0x00
 
+# Maximum number of bytes in one SMBus block write (command byte + 32 data bytes)
+I2C_BLOCK_SIZE = 33
+
 # Control bits
 En = 0b00000100 # Enable bit
 Rw = 0b00000010 # Read/Write bit
@@ -92,6 +106,18 @@ class i2c_device:
 	def write_block_data(self, cmd, data):
 		self.bus.write_block_data(self.addr, cmd, data)
 		sleep(0.0001)
+
+	# Write a stream of raw bytes in as few transactions as possible
+	# PCF8574 has no registers, so every byte (even the "command" one) goes to its port
+	def write_bytes(self, data):
+		# smbus2 can send everything in one transaction
+		if hasattr(smbus, 'i2c_msg'):
+			self.bus.i2c_rdwr(smbus.i2c_msg.write(self.addr, data))
+			return
+			
+		# Otherwise split it into blocks
+		for i in range(0, len(data), I2C_BLOCK_SIZE):
+			self.bus.write_i2c_block_data(self.addr, data[i], data[i + 1:i + I2C_BLOCK_SIZE])
 	
 
 class i2c_display(display.display):
@@ -99,7 +125,7 @@ class i2c_display(display.display):
 	''' OVERRIDED FROM DISPLAY '''
 	def lcd_initialize(self):		
 		# Initialize I2C_Device
-		self.lcd_device = i2c_device(self.address)
+		self.lcd_device = self.lcd_open_device()
 		
 		self.lcd_write(0x03)
 		self.lcd_write(0x03)
@@ -113,8 +139,18 @@ class i2c_display(display.display):
 
 		self._displaycontrol = LCD_DISPLAYCONTROL | LCD_DISPLAYON | LCD_CURSORON | LCD_BLINKON
 
+		# Shadow copy of what LCD is showing right now, one list of characters per row
+		# Display is cleared, so it's filled with spaces
+		self.lcd_shadow = []
+		for i in range(self.rows):
+			self.lcd_shadow.append([' '] * self.columns)
+
 		sleep(0.2)
 		
+	# Open the device LCD is connected to, emulated display overrides it
+	def lcd_open_device(self):
+		return i2c_device(self.address)
+		
 	# Toggle backlight on/off, it uses a variable with stored data
 	''' OVERRIDED FROM DISPLAY '''
 	def lcd_backlight(self, state):
@@ -154,31 +190,69 @@ class i2c_display(display.display):
 	def lcd_write_char(self, charvalue, mode=1):
 		self.lcd_write_four_bits(mode | (charvalue & 0xF0))
 		self.lcd_write_four_bits(mode | ((charvalue << 4) & 0xF0))
+		
+	# Expand a command (mode = 0) or character (mode = 1) into bytes for the expander
+	# Each nibble is data, data + En and data - En, like lcd_write_four_bits does
+	# Bus is slow enough (~90 us per byte at 100 kHz) so we don't need any sleep between them
+	def lcd_expand(self, stream, value, mode):
+		if (self.backlight_state == True):
+			backlight = LCD_BACKLIGHT
+		else:
+			backlight = LCD_NOBACKLIGHT
+			
+		for data in (mode | (value & 0xF0), mode | ((value << 4) & 0xF0)):
+			stream.append(data | backlight)
+			stream.append(data | En | backlight)
+			stream.append((data & ~En) | backlight)
 	
 	# Write whole message to LCD - uses \n as new line !!
+	# Only characters which differ from shadow copy are sent, every run of changed
+	# characters starts with a jump to its RAM address
 	''' OVERRIDED FROM DISPLAY '''
 	def lcd_message(self, text):
-		count = 1
-		self.lcd_write(LCD_LINE_1)
+		lines = text.split('\n')
+		stream = []
 		
-		# Iterate through all chars in message
-		for char in text:
-			# Check if char is \n -> go to new line
-			if char == '\n':
-				if (count == 1 and self.rows >= 2):
-					self.lcd_write(LCD_LINE_2)
-				elif (count == 2 and self.rows >= 3):
-					self.lcd_write(LCD_LINE_3)
-				elif (count == 3 and self.rows >= 4):
-					self.lcd_write(LCD_LINE_4)
-				count = count + 1
-			else:
-				self.lcd_write_char(ord(char))
+		# Iterate through all rows in message
+		for row in range(min(len(lines), self.rows)):
+			line = lines[row][:self.columns]
+			shadow = self.lcd_shadow[row]
+			
+			column = 0
+			while (column < len(line)):
+				# Skip characters which are already on the screen
+				if (line[column] == shadow[column]):
+					column += 1
+					continue
+				
+				# Find the end of changed run; jumping costs the same as writing one
+				# character, so a single unchanged character inside the run is rewritten
+				end = column + 1
+				while (end < len(line)):
+					if (line[end] != shadow[end]):
+						end += 1
+					elif (end + 1 < len(line) and line[end + 1] != shadow[end + 1]):
+						end += 2
+					else:
+						break
+				
+				# Jump to the start of the run and write it
+				self.lcd_expand(stream, LCD_LINES[row] + column, 0)
+				for i in range(column, end):
+					self.lcd_expand(stream, ord(line[i]), Rs)
+					shadow[i] = line[i]
+					
+				column = end
+				
+		# Send the whole frame at once
+		if stream:
+			self.lcd_device.write_bytes(stream)
 				
-	# Load custom characters into display CGRAM (0 - 7)
+	# Load one custom character into display CGRAM, on place slot (0 - 7)
 	''' OVERRIDED FROM DISPLAY '''
-	def lcd_load_custom_chars(self, fontdata):
-		self.lcd_write(0x40);
-		for char in fontdata:
-			for line in char:
-				self.lcd_write_char(line)   
\ No newline at end of file
+	def lcd_load_custom_char(self, slot, fontdata):
+		stream = []
+		self.lcd_expand(stream, LCD_SETCGRAMADDR | (slot << 3), 0)
+		for line in fontdata:
+			self.lcd_expand(stream, line, Rs)
+		self.lcd_device.write_bytes(stream)
@@ -0,0 +1,147 @@
+''' INPUT_REMOTE - Inherits remote class from ir_remote.py '''
+
+# Newer kernels decode IR remotes themselves (rc-core) and show them as input devices
+# (/dev/input/eventN), just like USB keyboards and keypads; this remote reads key events
+# from them directly, so LIRC isn't needed. Keys do the same actions as with LIRC remote
+
+import ir_remote, os, re, select, struct, fcntl, errno, time
+
+# struct input_event: time (seconds, microseconds), type, code and value
+INPUT_EVENT = struct.Struct('llHHi')
+
+# Event type for keys, values: 0 - released, 1 - pressed, 2 - autorepeat (held)
+EV_KEY = 1
+KEY_RELEASED = 0
+KEY_PRESSED = 1
+KEY_REPEATED = 2
+
+# _IOW('E', 0x90, int), grabbed device sends its events only to us (not to console)
+EVIOCGRAB = 0x40044590
+
+# How many events are read at once
+BATCH_SIZE = 64
+
+# How often we try to open devices which aren't available (in seconds)
+REOPEN_DELAY = 2
+
+# Codes of keys used by remotes and keypads, others are read from kernel headers if they exist
+KEY_CODES = {
+	1: 'KEY_ESC', 14: 'KEY_BACKSPACE', 28: 'KEY_ENTER', 57: 'KEY_SPACE',
+	2: 'KEY_1', 3: 'KEY_2', 4: 'KEY_3', 5: 'KEY_4', 6: 'KEY_5', 7: 'KEY_6', 8: 'KEY_7', 9: 'KEY_8', 10: 'KEY_9', 11: 'KEY_0',
+	55: 'KEY_KPASTERISK', 69: 'KEY_NUMLOCK', 71: 'KEY_KP7', 72: 'KEY_KP8', 73: 'KEY_KP9', 74: 'KEY_KPMINUS',
+	75: 'KEY_KP4', 76: 'KEY_KP5', 77: 'KEY_KP6', 78: 'KEY_KPPLUS', 79: 'KEY_KP1', 80: 'KEY_KP2', 81: 'KEY_KP3',
+	82: 'KEY_KP0', 83: 'KEY_KPDOT', 96: 'KEY_KPENTER', 98: 'KEY_KPSLASH',
+	103: 'KEY_UP', 105: 'KEY_LEFT', 106: 'KEY_RIGHT', 108: 'KEY_DOWN',
+	113: 'KEY_MUTE', 114: 'KEY_VOLUMEDOWN', 115: 'KEY_VOLUMEUP', 116: 'KEY_POWER', 119: 'KEY_PAUSE',
+	128: 'KEY_STOP', 163: 'KEY_NEXTSONG', 164: 'KEY_PLAYPAUSE', 165: 'KEY_PREVIOUSSONG', 166: 'KEY_STOPCD',
+	207: 'KEY_PLAY', 352: 'KEY_OK', 398: 'KEY_RED', 399: 'KEY_GREEN', 400: 'KEY_YELLOW', 401: 'KEY_BLUE',
+	407: 'KEY_NEXT', 408: 'KEY_RESTART', 410: 'KEY_SHUFFLE', 412: 'KEY_PREVIOUS', 439: 'KEY_MEDIA_REPEAT'
+}
+
+# Read all key names from kernel header, returns code => name
+def read_key_codes(path='/usr/include/linux/input-event-codes.h'):
+	codes = dict(KEY_CODES)
+
+	try:
+		with open(path) as f:
+			for name, value in re.findall(r'#define\s+(KEY_\w+)\s+(0x[0-9a-fA-F]+|\d+)\b', f.read()):
+				code = int(value, 0)
+				if (code not in KEY_CODES): # Names we know are kept (some codes have two names)
+					codes[code] = name
+	except IOError:
+		pass
+
+	return codes
+
+class input_remote(ir_remote.remote):
+	# Class constructor, receives list of input device paths and key => action table (optional)
+	def __init__(self, devices, keys=ir_remote.KEYS):
+		ir_remote.remote.__init__(self, None, None, keys)
+		self.devices = devices
+		self.key_codes = read_key_codes()
+
+		# Opened devices, file descriptor => path
+		self.fds = {}
+
+		# Held key of each device (file descriptor => ir_remote.held_key), devices don't disturb each other
+		self.held_keys = {}
+
+	# Open all devices which aren't opened yet
+	def open_devices(self):
+		opened = self.fds.values()
+
+		for path in self.devices:
+			if (path in opened):
+				continue
+
+			try:
+				fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+			except OSError:
+				continue
+
+			# Keys mustn't reach console (or whoever has it open) too
+			try:
+				fcntl.ioctl(fd, EVIOCGRAB, 1)
+			except IOError as e:
+				print('Input device ' + path + ' can\'t be grabbed (' + str(e) + '), other programs get its keys too')
+
+			self.fds[fd] = path
+			self.held_keys[fd] = ir_remote.held_key()
+
+	# Close device (for example, it was unplugged)
+	def close_device(self, fd):
+		print('Input device ' + self.fds.pop(fd) + ' is not available anymore')
+		del self.held_keys[fd]
+		os.close(fd)
+
+	# Handle all events read from one device
+	def handle_events(self, fd, data):
+		held = self.held_keys[fd]
+
+		for position in range(0, len(data) - INPUT_EVENT.size + 1, INPUT_EVENT.size):
+			seconds, microseconds, type, code, value = INPUT_EVENT.unpack_from(data, position)
+
+			if (type != EV_KEY):
+				continue
+
+			# Key press and autorepeat are counted like LIRC does it
+			if (value == KEY_PRESSED):
+				held.repeat = 0
+			elif (value == KEY_REPEATED):
+				held.repeat += 1
+			else:
+				continue
+
+			self.key_pressed(self.key_codes.get(code, str(code)), held.repeat, held)
+
+	# Main thread
+	''' OVERRIDED FROM REMOTE '''
+	def remote_thread(self):
+		while True:
+			# Devices can be plugged in later
+			if (len(self.fds) < len(self.devices)):
+				self.open_devices()
+				timeout = REOPEN_DELAY
+			else:
+				timeout = None
+
+			if not self.fds:
+				time.sleep(REOPEN_DELAY)
+				continue
+
+			# Wait for events from any device, read as much as we can at once
+			ready = select.select(list(self.fds), [], [], timeout)[0]
+
+			for fd in ready:
+				try:
+					data = os.read(fd, INPUT_EVENT.size * BATCH_SIZE)
+				except OSError as e:
+					if (e.errno != errno.EAGAIN):
+						self.close_device(fd)
+					continue
+
+				if not data:
+					self.close_device(fd)
+					continue
+
+				self.handle_events(fd, data)
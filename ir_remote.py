@@ -1,17 +1,106 @@
-import os, threading, time
+import os, stat, threading, socket, select, subprocess
+from clock import monotonic
 
-# Instance of this class will receive commands from IR remote via pipeline
+# Default key => action table
+# Actions: MPD commands (PLAY, STOP, NEXT, PREV, VUP, VDN, SHUFFLE, REPEAT, SINGLE),
+# SCREEN (change screen), BACKLIGHT (toggle LCD backlight), POWEROFF and REBOOT
+KEYS = {
+	'KEY_PLAY': 'PLAY',
+	'KEY_PLAYPAUSE': 'PLAY',
+	'KEY_PAUSE': 'PLAY',
+	'KEY_STOP': 'STOP',
+	'KEY_NEXT': 'NEXT',
+	'KEY_NEXTSONG': 'NEXT',
+	'KEY_PREVIOUS': 'PREV',
+	'KEY_PREVIOUSSONG': 'PREV',
+	'KEY_VOLUMEUP': 'VUP',
+	'KEY_VOLUMEDOWN': 'VDN',
+	'KEY_SHUFFLE': 'SHUFFLE',
+	'KEY_MEDIA_REPEAT': 'REPEAT',
+	'KEY_RED': 'SHUFFLE',
+	'KEY_GREEN': 'REPEAT',
+	'KEY_YELLOW': 'SINGLE',
+	'KEY_ENTER': 'SCREEN',
+	'KEY_OK': 'SCREEN',
+	'KEY_MUTE': 'BACKLIGHT',
+	'KEY_POWER': 'POWEROFF',
+	'KEY_RESTART': 'REBOOT',
+	'KEY_KP5': 'PLAY', # Numeric keypad (input devices)
+	'KEY_KP0': 'STOP',
+	'KEY_KP6': 'NEXT',
+	'KEY_KP4': 'PREV',
+	'KEY_KPPLUS': 'VUP',
+	'KEY_KPMINUS': 'VDN',
+	'KEY_KPENTER': 'SCREEN',
+	'KEY_KPASTERISK': 'BACKLIGHT'
+}
+
+# Actions which are given to MPD
+MPD_ACTIONS = ('PLAY', 'STOP', 'NEXT', 'PREV', 'VUP', 'VDN', 'SHUFFLE', 'REPEAT', 'SINGLE')
+
+# System commands for power actions, they are done only when the key is held for SYSTEM_HOLD_TIME
+# (in seconds), one accidental press mustn't shut the player down
+SYSTEM_HOLD_TIME = 3
+SYSTEM_ACTIONS = {
+	'POWEROFF': ['systemctl', 'poweroff'],
+	'REBOOT': ['systemctl', 'reboot']
+}
+
+# Actions which are repeated while the key is held, others are done only once per press
+REPEAT_ACTIONS = ('VUP', 'VDN')
+
+# Held key starts repeating after REPEAT_DELAY, first with REPEAT_INTERVAL between actions
+# Every repeat makes the interval shorter (REPEAT_ACCELERATION), down to REPEAT_INTERVAL_MIN
+# All in seconds; remote sends repeats much faster, those in between are ignored
+REPEAT_DELAY = 0.4
+REPEAT_INTERVAL = 0.25
+REPEAT_ACCELERATION = 0.8
+REPEAT_INTERVAL_MIN = 0.08
+
+# Default path of lircd socket
+LIRC_SOCKET = '/var/run/lirc/lircd'
+
+# Delay before connecting to lircd again (in seconds), it's doubled after every failed attempt up to the maximum
+# Meanwhile, commands are read from pipeline
+RECONNECT_DELAY = 2
+RECONNECT_DELAY_MAX = 30
+
+# State of the key which is held on one remote (or input device)
+class held_key:
+	# Class constructor
+	def __init__(self):
+		# Key which is held, when it was pressed, when its action was repeated and next interval
+		self.key = None
+		self.pressed_at = 0
+		self.repeated_at = 0
+		self.interval = REPEAT_INTERVAL
+		
+		# Whether the power action was already done
+		self.done = False
+		
+		# Number of repeated events (used by input devices, lircd counts them itself)
+		self.repeat = 0
+		
+# Instance of this class will receive commands from IR remote
+# It connects directly to lircd socket, while it can't, it reads them from pipeline (irexec)
 class remote:
-	# Class constructor, received pipeline name (path)
-	def __init__(self, ir_pipe_path):
+	# Class constructor, receives pipeline name (path), lircd socket path (optional)
+	# and key => action table (optional)
+	def __init__(self, ir_pipe_path, lirc_socket=LIRC_SOCKET, keys=KEYS):
 		self.pipe = ir_pipe_path
+		self.lirc_socket = lirc_socket
+		self.keys = keys
 		
-		# If FIFO pipe doesn't exists, create it
-		if not os.path.exists(ir_pipe_path):
-			os.mkfifo(ir_pipe_path)
-			
-		# Initialize display client
+		# Initialize display and MPD client
 		self.display = False
+		self.mpd = False
+		
+		# State of the held key
+		self.held = held_key()
+		
+		# Pipeline file descriptor (None - not opened) and incomplete line read from it
+		self.pipe_fd = None
+		self.pipe_data = ''
 		
 		# No thread currently
 		self.ir_t = False
@@ -20,33 +109,231 @@ class remote:
 	def register_display(self, display):
 		self.display = display
 		
+	# Register MPD client so this thread can send commands to it
+	def register_mpd(self, mpd):
+		self.mpd = mpd
+		
+	# Do what the key says; repeat is number of repeated events while the key is held (0 - new press)
+	# Held is state of the remote the key comes from (optional, there's only one by default)
+	def key_pressed(self, key, repeat=0, held=None):
+		action = self.keys.get(key)
+		if (action == None):
+			return
+			
+		if (held == None):
+			held = self.held
+			
+		now = monotonic()
+		
+		# New press, action is done right away (except power actions)
+		if (repeat == 0):
+			held.key = key
+			held.pressed_at = now
+			held.repeated_at = now
+			held.interval = REPEAT_INTERVAL
+			held.done = False
+			
+			if (action not in SYSTEM_ACTIONS):
+				self.do_action(action)
+			return
+			
+		if (key != held.key):
+			return
+			
+		# Power action is done once, when the key has been held long enough
+		if (action in SYSTEM_ACTIONS):
+			if (not held.done and (now - held.pressed_at) >= SYSTEM_HOLD_TIME):
+				held.done = True
+				self.do_action(action)
+			return
+			
+		# Key is held; only some actions are repeated, not faster than the current interval
+		if (action not in REPEAT_ACTIONS):
+			return
+			
+		if ((now - held.pressed_at) < REPEAT_DELAY or (now - held.repeated_at) < held.interval):
+			return
+			
+		held.repeated_at = now
+		held.interval = max(held.interval * REPEAT_ACCELERATION, REPEAT_INTERVAL_MIN)
+		self.do_action(action)
+		
+	# Do the action
+	def do_action(self, action):
+		if (action in MPD_ACTIONS):
+			if (self.mpd != False):
+				self.mpd.commands(action)
+				
+		# Change display mode
+		elif (action == 'SCREEN'):
+			if (self.display != False):
+				self.display.change_screen()
+				
+		# Toggle backlight
+		elif (action == 'BACKLIGHT'):
+			if (self.display != False):
+				self.display.toggle_backlight()
+				
+		# Power off or reboot
+		elif (action in SYSTEM_ACTIONS):
+			subprocess.call(SYSTEM_ACTIONS[action])
+			
+	# Parse one line from lircd: code, repeat count (hex), key name and remote name
+	# Returns (key, repeat) or None if it isn't a key event
+	def parse_event(self, line):
+		data = line.split()
+		if (len(data) != 4):
+			return None
+			
+		try:
+			return (data[2], int(data[1], 16))
+		except ValueError:
+			return None
+			
+	# Connect to lircd socket, returns socket or None if lircd isn't running
+	def lirc_connect(self):
+		sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		try:
+			sock.connect(self.lirc_socket)
+		except socket.error:
+			sock.close()
+			return None
+		return sock
+		
+	# Read key events from lircd socket until it closes
+	# Keys which come through pipeline meanwhile are dropped, so irexec (if it runs) never waits
+	def lirc_read(self, sock):
+		data = ''
+		reply = False # Replies to commands (BEGIN ... END) aren't key events
+		
+		while True:
+			ready = select.select([sock, self.pipe_fd], [], [])[0]
+			
+			if (self.pipe_fd in ready):
+				self.pipe_handle(False)
+				
+			if (sock not in ready):
+				continue
+				
+			try:
+				temp = sock.recv(4096)
+			except socket.error:
+				temp = ''
+				
+			if not temp:
+				sock.close()
+				return
+				
+			data += temp
+			
+			# Every complete line is one event, incomplete one waits for the rest
+			lines = data.split('\n')
+			data = lines.pop()
+			
+			for line in lines:
+				if (line == 'BEGIN'):
+					reply = True
+				elif (line == 'END'):
+					reply = False
+				elif not reply:
+					event = self.parse_event(line)
+					if (event != None):
+						self.key_pressed(*event)
+						
+	# Open pipeline, it stays open all the time
+	# irexec (echo "KEY" > pipeline) makes a regular file if nothing is there, so anything which isn't FIFO is replaced
+	# It's opened for reading and writing, so opening doesn't wait for irexec, reading doesn't end
+	# when irexec closes it and irexec never waits for a reader
+	def pipe_open(self):
+		try:
+			if not stat.S_ISFIFO(os.stat(self.pipe).st_mode):
+				os.remove(self.pipe)
+		except OSError:
+			pass # It doesn't exist
+			
+		if not os.path.exists(self.pipe):
+			os.mkfifo(self.pipe)
+			
+		self.pipe_fd = os.open(self.pipe, os.O_RDWR | os.O_NONBLOCK)
+		self.pipe_data = ''
+		
+	# Close pipeline
+	def pipe_close(self):
+		if (self.pipe_fd != None):
+			os.close(self.pipe_fd)
+			self.pipe_fd = None
+			
+	# Read what is in pipeline, key names are one per line
+	# Keys are used only if use is True, otherwise (lircd socket is used) they are dropped
+	def pipe_handle(self, use):
+		try:
+			temp = os.read(self.pipe_fd, 4096)
+		except OSError:
+			return
+			
+		# End of file, our FIFO isn't there anymore; open (and make) it again
+		if not temp:
+			self.pipe_close()
+			self.pipe_open()
+			return
+			
+		# Every complete line is one key, incomplete one waits for the rest
+		lines = (self.pipe_data + temp).split('\n')
+		self.pipe_data = lines.pop()
+		
+		if not use:
+			return
+			
+		for line in lines:
+			message = line.strip()
+			if message:
+				self.key_pressed(message)
+				
+	# Read key names from pipeline for given time (in seconds)
+	def pipe_read(self, timeout):
+		deadline = monotonic() + timeout
+		
+		while True:
+			remaining = deadline - monotonic()
+			if (remaining <= 0):
+				return
+				
+			if select.select([self.pipe_fd], [], [], remaining)[0]:
+				self.pipe_handle(True)
+				
 	# Main thread
+	# Read from lircd; while it isn't available (not started yet, restarting), read from pipeline
+	# and try to connect again, waiting longer after every failed attempt
 	def remote_thread(self):
-		pipe_fd = os.open(self.pipe, os.O_RDONLY) # Open pipe
-		with os.fdopen(pipe_fd) as pipe:
-			# Read messages every 10 ms
-			while True:
-				message = pipe.read().strip() # Read message from pipe
-				if message:
-					# Change display mode
-					if (message == 'KEY_ENTER'):
-						if (self.display != False):
-							self.display.change_screen()
-							
-					# Toggle backlight
-					if (message == 'KEY_MUTE'):
-						if (self.display != False):
-							self.display.toggle_backlight()
-				time.sleep(0.01)
+		self.pipe_open()
+		delay = RECONNECT_DELAY
+		fallback = False
+		
+		while True:
+			sock = self.lirc_connect()
+			
+			if (sock != None):
+				delay = RECONNECT_DELAY
+				fallback = False
+				self.lirc_read(sock)
+				
+			# lircd socket isn't available (or it has just gone away), use pipeline (fallback)
+			if not fallback:
+				print('lircd (' + self.lirc_socket + ') is not available, using pipeline ' + self.pipe + ' meanwhile')
+				fallback = True
+				
+			self.pipe_read(delay)
+			
+			if (sock == None):
+				delay = min(delay * 2, RECONNECT_DELAY_MAX)
 				
 	# Start main remote thread
 	def start(self):
 		self.ir_t = threading.Thread(target=self.remote_thread, args = ()) # Create thread for updating LCD
 		self.ir_t.daemon = True # Yep, it's a daemon, when main thread finish, this one will finish too
 		self.ir_t.start() # Start it!
-	
+		
 	# Function for waiting the thread to finish
 	def join(self):
 		if (self.ir_t != False):
 			self.ir_t.join()
-		
\ No newline at end of file
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+import unicodedata
+
+# HD44780 displays (A00 ROM, the common one) have ASCII in 0x20 - 0x7D, except:
+# 0x5C is yen sign (instead of backslash) and 0x7E, 0x7F are arrows (instead of tilde and DEL)
+# Upper half has Japanese katakana and some European and Greek characters
+# Characters 0x00 - 0x07 are custom characters (CGRAM), so text must never contain them
+
+# Characters which have their own place in A00 ROM (or a close look-alike)
+CHARACTERS = {
+	u'\\': '/', # There's no backslash
+	u'~': '-', # There's no tilde
+	u'¥': '\x5c', # Yen sign
+	u'→': '\x7e', # Right arrow
+	u'←': '\x7f', # Left arrow
+	u'·': '\xa5', # Middle dot
+	u'•': '\xa5', # Bullet
+	u'α': '\xe0', # Greek alpha
+	u'ä': '\xe1', # a umlaut
+	u'Ä': '\xe1', # A umlaut, there are no uppercase umlauts
+	u'ß': '\xe2', # Sharp s (beta)
+	u'β': '\xe2', # Greek beta
+	u'ε': '\xe3', # Greek epsilon
+	u'µ': '\xe4', # Micro sign
+	u'μ': '\xe4', # Greek mu
+	u'σ': '\xe5', # Greek sigma
+	u'ρ': '\xe6', # Greek rho
+	u'√': '\xe8', # Square root
+	u'¢': '\xec', # Cent sign
+	u'ñ': '\xee', # n tilde
+	u'Ñ': '\xee', # N tilde
+	u'ö': '\xef', # o umlaut
+	u'Ö': '\xef', # O umlaut
+	u'θ': '\xf2', # Greek theta
+	u'∞': '\xf3', # Infinity
+	u'Ω': '\xf4', # Greek Omega
+	u'Ω': '\xf4', # Ohm sign
+	u'ü': '\xf5', # u umlaut
+	u'Ü': '\xf5', # U umlaut
+	u'Σ': '\xf6', # Greek Sigma
+	u'π': '\xf7', # Greek pi
+	u'÷': '\xfd', # Division sign
+	u'°': '\xdf', # Degree sign
+	u'‘': "'", # Typographic quotes and dashes
+	u'’': "'",
+	u'‚': "'",
+	u'“': '"',
+	u'”': '"',
+	u'„': '"',
+	u'«': '<',
+	u'»': '>',
+	u'‐': '-',
+	u'–': '-',
+	u'—': '-',
+	u'×': 'x' # Multiplication sign
+}
+
+# Character which is shown when there's no way to show the character
+UNKNOWN = '?'
+
+# Encode one character for LCD
+def encode_character(character):
+	if (character in CHARACTERS):
+		return CHARACTERS[character]
+
+	# Printable ASCII is the same
+	if (u' ' <= character < u'\x7f'):
+		return str(character)
+
+	# Control characters (tabs, new lines) are shown as spaces, they could be custom characters
+	if (character < u' '):
+		return ' '
+
+	# Try without accents (for example, c with caron is c + caron) and compatibility forms
+	temp = ''
+	for part in unicodedata.normalize('NFKD', character):
+		if unicodedata.combining(part):
+			continue
+
+		if (part in CHARACTERS or u' ' <= part < u'\x7f'):
+			temp += encode_character(part)
+		else:
+			return UNKNOWN
+
+	if temp:
+		return temp
+
+	return UNKNOWN
+
+# Encode text (unicode or UTF-8 string) to bytes which can be written to LCD as they are
+def encode(text):
+	if not isinstance(text, unicode):
+		text = text.decode('utf-8', 'replace')
+
+	return ''.join([encode_character(character) for character in text])
@@ -67,6 +67,61 @@ class IteratingError(MPDError):
     pass
 
 
+class _SocketReader(object):
+    """Reads lines from a socket through one reusable buffer.
+
+    Data is received straight into the buffer with recv_into.  All complete
+    lines in it are split off at once, a partial line stays in the buffer
+    until the rest of it arrives.
+    """
+
+    def __init__(self, sock, size=65536):
+        self._sock = sock
+        self._buffer = bytearray(size)
+        self._view = memoryview(self._buffer)
+        self._end = 0
+        # Complete lines, in reverse order
+        self._lines = []
+
+    def readline(self):
+        """Return the next line without newline, None if connection is closed"""
+        while not self._lines:
+            if not self._fill():
+                return None
+        return self._lines.pop()
+
+    def _fill(self):
+        # Line is longer than the buffer, make it bigger
+        if self._end == len(self._buffer):
+            self._view = None
+            self._buffer.extend(bytearray(len(self._buffer)))
+            self._view = memoryview(self._buffer)
+        read = self._sock.recv_into(self._view[self._end:])
+        if not read:
+            return False
+        end = self._end + read
+        last = self._buffer.rfind(b"\n", self._end, end)
+        self._end = end
+        if last < 0:
+            return True
+        # Chunk ends with a newline, so UTF-8 characters are never cut
+        chunk = self._view[:last].tobytes()
+        if not IS_PYTHON2:
+            chunk = chunk.decode("utf-8")
+        lines = chunk.split("\n" if not IS_PYTHON2 else b"\n")
+        lines.reverse()
+        self._lines = lines
+        # Move the partial line to the front
+        rest = end - last - 1
+        self._view[:rest] = self._view[last + 1:end]
+        self._end = rest
+        return True
+
+    def close(self):
+        self._sock = None
+        self._lines = []
+
+
 class _NotConnected(object):
     def __getattr__(self, attr):
         return self._dummy
@@ -263,13 +318,14 @@ class MPDClient(object):
         self._write_line(" ".join(parts))
 
     def _read_line(self):
-        line = self._rfile.readline()
-        if self.use_unicode:
-            line = decode_str(line)
-        if not line.endswith("\n"):
+        return self._check_line(self._rfile.readline())
+
+    def _check_line(self, line):
+        if line is None:
             self.disconnect()
             raise ConnectionError("Connection lost while reading line")
-        line = line.rstrip("\n")
+        if self.use_unicode:
+            line = decode_str(line)
         if line.startswith(ERROR_PREFIX):
             error = line[len(ERROR_PREFIX):].strip()
             raise CommandError(error)
@@ -292,10 +348,21 @@ class MPDClient(object):
         return pair
 
     def _read_pairs(self, separator=": "):
-        pair = self._read_pair(separator)
-        while pair:
+        # Lines are taken straight from the reader, only the ones which can
+        # end the response (or have to be decoded) go through _check_line
+        readline = self._rfile.readline
+        check = self.use_unicode
+        while True:
+            line = readline()
+            if (check or line is None or line == SUCCESS or line == NEXT or
+                    line.startswith(ERROR_PREFIX)):
+                line = self._check_line(line)
+                if line is None:
+                    return
+            pair = line.split(separator, 1)
+            if len(pair) < 2:
+                raise ProtocolError("Could not parse pair: '%s'" % line)
             yield pair
-            pair = self._read_pair(separator)
 
     def _read_list(self):
         seen = None
@@ -313,8 +380,14 @@ class MPDClient(object):
 
     def _read_objects(self, delimiters=[]):
         obj = {}
+        # Every song has the same few keys, lower each of them only once
+        lowered = {}
         for key, value in self._read_pairs():
-            key = key.lower()
+            try:
+                key = lowered[key]
+            except KeyError:
+                lowered[key] = key.lower()
+                key = lowered[key]
             if obj:
                 if key in delimiters:
                     yield obj
@@ -438,10 +511,9 @@ class MPDClient(object):
 
     def _hello(self):
         line = self._rfile.readline()
-        if not line.endswith("\n"):
+        if line is None:
             self.disconnect()
             raise ConnectionError("Connection lost while reading MPD hello")
-        line = line.rstrip("\n")
         if not line.startswith(HELLO_PREFIX):
             raise ProtocolError("Got invalid MPD hello: '%s'" % line)
         self.mpd_version = line[len(HELLO_PREFIX):].strip()
@@ -515,13 +587,12 @@ class MPDClient(object):
         else:
             self._sock = self._connect_tcp(host, port)
 
+        self._rfile = _SocketReader(self._sock)
         if IS_PYTHON2:
-            self._rfile = self._sock.makefile("r")
             self._wfile = self._sock.makefile("w")
         else:
             # Force UTF-8 encoding, since this is dependant from the LC_CTYPE
             # locale.
-            self._rfile = self._sock.makefile("r", encoding="utf-8")
             self._wfile = self._sock.makefile("w", encoding="utf-8")
 
         try:
@@ -1,35 +1,142 @@
-from mpd import (MPDClient, CommandError)
-import threading, time, math
+from mpd import (MPDClient, CommandError, ConnectionError, ProtocolError)
+import threading, time, socket, select, os, collections, event_bus, lcd_charset
+from clock import monotonic
 
+# Delay before reconnecting to MPD (in seconds), it's doubled after every failed attempt up to the maximum
+RECONNECT_DELAY = 0.5
+RECONNECT_DELAY_MAX = 30
+
+# Timeout for connecting and for commands (in seconds), idle waits without it
+SOCKET_TIMEOUT = 10
+
+# Errors which mean that connection to MPD is lost (or that it can't be made)
+# Malformed or truncated reply leaves the connection in unknown state, so it's made again too
+CONNECTION_ERRORS = (socket.error, ConnectionError, ProtocolError)
+
+# Commands needed to refresh data which belongs to each MPD subsystem (from idle)
+SUBSYSTEM_COMMANDS = {
+	'mixer': ('status',),
+	'options': ('status',),
+	'player': ('status', 'currentsong'),
+	'playlist': ('status', 'currentsong'), # Web radio title changes come as playlist changes
+	'database': ('stats',)
+}
+
+# How many normalized tags (artist, title, station) are remembered
+TAG_CACHE_SIZE = 64
+
+# Relative commands and their steps; runs of them (for example fast button presses)
+# are merged into one MPD command: volume steps into setvol, song steps into play
+VOLUME_STEPS = {'VUP': 5, 'VDN': -5}
+SKIP_STEPS = {'NEXT': 1, 'PREV': -1}
+
+# Commands which toggle play mode options: data key and MPD command
+# Run of the same toggle is sent once, only if it has an odd number of them
+TOGGLE_OPTIONS = {
+	'SHUFFLE': ('shuffle', 'random'),
+	'REPEAT': ('repeat_all', 'repeat'),
+	'SINGLE': ('repeat_single', 'single')
+}
+
+# How long the volume we asked for is used instead of the one MPD reported (in seconds)
+# MPD reports the new volume only after a while, until then further steps start from ours
+VOLUME_TARGET_TIMEOUT = 1.0
+
+# Play mode options, in order of their type for LCD
+PLAY_MODES = ('shuffle', 'repeat_all', 'repeat_single')
+
+# Data shown on the LCD screens, which is updated from player and playlist subsystems
+PLAYER_DATA = ('artist', 'title', 'type', 'state', 'elapsed_time', 'total_time', 'bitrate')
+
+# Names of all player data, each snapshot has all of them
+STATE_KEYS = ('artist', 'title', 'type', 'state', 'volume', 'shuffle', 'repeat_all', 'repeat_single',
+	'elapsed', 'elapsed_at', 'total_time', 'bitrate', 'playtime', 'uptime', 'stats_at', 'song_position',
+	'playlist_length')
+	
+# Change names for data which is notified under a different name (times are calculated from them)
+STATE_CHANGES = {
+	'elapsed': ('elapsed_time',),
+	'elapsed_at': ('elapsed_time',),
+	'stats_at': ('playtime', 'uptime')
+}
+
+# Snapshot of player data, it can't be changed after it's made
+# MPD thread makes a new one after every update and swaps it in, so readers always get data
+# from one moment; version is increased with every new snapshot
+class player_state(object):
+	__slots__ = ('version',) + STATE_KEYS
+	
+	# Make snapshot with given version from data dictionary
+	def __init__(self, version, data):
+		object.__setattr__(self, 'version', version)
+		for key in STATE_KEYS:
+			object.__setattr__(self, key, data[key])
+			
+	# Snapshot is immutable
+	def __setattr__(self, name, value):
+		raise AttributeError('player_state is immutable')
+		
+	# Return names of data which differ from older snapshot, like updateData returns them
+	def changesFrom(self, old):
+		changes = set()
+		for key in STATE_KEYS:
+			if (getattr(self, key) != getattr(old, key)):
+				changes.update(STATE_CHANGES.get(key, (key,)))
+				
+		return changes
+		
+	# Return current song elapsed time in seconds (float)
+	# It's calculated from the last fetched value, we don't have to ask MPD every second
+	# Times aren't calculated until they are fetched for the first time (their time is None)
+	def getElapsed(self):
+		if (self.state == 1 and self.elapsed_at != None):
+			return self.elapsed + (monotonic() - self.elapsed_at)
+			
+		return self.elapsed
+		
+	# Return current total uptime from last reboot in seconds (float)
+	def getUptime(self):
+		if (self.stats_at == None):
+			return self.uptime
+			
+		return self.uptime + (monotonic() - self.stats_at)
+		
+	# Return current total playing time from last reboot in seconds (float)
+	def getPlaytime(self):
+		if (self.state == 1 and self.stats_at != None):
+			return self.playtime + (monotonic() - self.stats_at)
+			
+		return self.playtime
+		
 class mpd_client:
 	def __init__(self, con_id, password):
-		# Create First MPD client(for status)
+		# Remember how to connect, we will need it again whenever connection is lost
+		self.con_id = con_id
+		self.password = password
+		
+		# Create MPD client, the same connection is used for status and for commands
 		self.client = MPDClient()
+		self.client.timeout = SOCKET_TIMEOUT
 		
-		# Create Second MPD client (for commands)
-		self.cmd_client = MPDClient()
+		# Commands from buttons and remote wait here until the main thread sends them
+		# Writing to the pipe wakes the main thread up while it waits for changes (idle)
+		self.command_queue = collections.deque()
+		self.wake_read, self.wake_write = os.pipe()
 		
-		# Connect to the MPD daemon (first client)
-		if (self.mpdConnect(self.client, con_id) == False):
-			print('Connection to MPD daemon (for status) failed!')
-			sys.exit(1)
-			
-		# Connect to the MPD daemon (second client)
-		if (self.mpdConnect(self.cmd_client, con_id) == False):
-			print('Connection to MPD daemon (for commands) failed!')
-			sys.exit(1)
-			
-		# If password is set, we have to authenticate
-		if password:
-			# First client
-			if (self.mpdAuth(self.client, password) == False):
-				print('MPD authentication (for status) failed!')
-				sys.exit(1)
-			
-			# Second client
-			if (self.mpdAuth(self.cmd_client, password) == False):
-				print('MPD authentication (for commands) failed!')
-				sys.exit(1)
+		# Client is connected by the main thread, it also reconnects it when MPD goes away
+		self.connected = False
+		self.connected_once = False
+		
+		# Connection statistics: number of reconnects and outage durations (in seconds)
+		self.reconnects = 0
+		self.outage_started = None
+		self.last_outage = 0.0
+		self.longest_outage = 0.0
+		self.total_outage = 0.0
+		
+		# Volume we asked for (optimistic) and when, None if we didn't ask for any
+		self.target_volume = None
+		self.target_volume_at = 0
 		
 		# Initialize data container
 		self.data = {
@@ -41,73 +148,170 @@ class mpd_client:
 			'shuffle': False, # True - ON, False - OFF
 			'repeat_all': False, # True - ON, False - OFF
 			'repeat_single': False, # True - ON, False - OFF
-			'elapsed_time': 0, # Song elapsed time
+			'elapsed': 0.0, # Song elapsed time (in seconds) when it was fetched
+			'elapsed_at': None, # Time (monotonic) when elapsed time was fetched, None - never
 			'total_time': 0, # Total song duration
 			'bitrate': 0, # Song/station bitrate (for example 320)
-			'playtime': 0, # Total playing time from last reboot
-			'uptime': 0 # Total uptime from last reboot
+			'playtime': 0, # Total playing time from last reboot, when it was fetched
+			'uptime': 0, # Total uptime from last reboot, when it was fetched
+			'stats_at': None, # Time (monotonic) when playtime and uptime were fetched, None - never
+			'song_position': -1, # Position of current song in playlist (-1 - no song)
+			'playlist_length': 0 # Number of songs in playlist
 		}
+		
+		# Data is changed only by the main thread, others get its snapshot
+		self.state = player_state(0, self.data)
 			
-		# Initialize LCD listener for changes
-		self.LCD_client = False
+		# Normalized tags, raw tag => LCD text, least recently used first
+		self.tag_cache = collections.OrderedDict()
+		self.tag_hits = 0
+		self.tag_misses = 0
+		
+		# Changes are published on the bus, LCD (and anyone else) subscribes to them there
+		self.bus = event_bus.event_bus()
 		
-		# Get first data update
-		self.updateData()
-	
 	# Function for connecting to MPD daemon
 	def mpdConnect(self, client, con_id):
 		try:
 			client.connect(**con_id)
-		except SocketError:
+		except CONNECTION_ERRORS:
 			return False
 		return True
 		
 	# Function for authenticating to MPD if password is set
-	def mpdAuth(client, pwd):
+	def mpdAuth(self, client, pwd):
 		try:
 			client.password(pwd)
-		except CommandError:
+		except (CommandError,) + CONNECTION_ERRORS:
 			return False
 		return True
 		
-	# Function for pinging cmd_client, we have to ping it or it will close connection
-	def mpdPing(self):
-		while True:
-			time.sleep(50) # We will ping it every 50 seconds
-			self.cmd_client.ping() # Ping it!
+	# Function for (re)opening connection of one client, old connection is closed first
+	def mpdOpen(self, client):
+		try:
+			client.disconnect()
+		except CONNECTION_ERRORS:
+			pass
+			
+		if (self.mpdConnect(client, self.con_id) == False):
+			return False
+			
+		# Commands are small and they come right after noidle, so don't let them wait for
+		# delayed ACK (Nagle's algorithm); unix socket doesn't have this option
+		try:
+			sock = socket.fromfd(client.fileno(), socket.AF_INET, socket.SOCK_STREAM)
+			sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+			sock.close()
+		except socket.error:
+			pass
 			
-	# Register LCD client listener
-	def register(self, lcd):
-		self.LCD_client = lcd
+		# If password is set, we have to authenticate
+		if (self.password and self.mpdAuth(client, self.password) == False):
+			print('MPD authentication failed!')
+			client.disconnect()
+			return False
+			
+		return True
 		
-	# Start MPD threads
-	def start(self):
-		# MPD Ping Thread - we have to ping cmd_client to prevent closing connection		
-		self.mpdping_t = threading.Thread(target=self.mpdPing, args = ()) # Create thread for pinging MPD
-		self.mpdping_t.daemon = True # Yep, it's a daemon, when main thread finish, this one will finish too
-		self.mpdping_t.start() # Start it!
+	# Function which connects the client, it tries until it succeeds
+	# After each failed attempt it waits twice as long as before, but not more than RECONNECT_DELAY_MAX
+	def mpdReconnect(self):
+		delay = RECONNECT_DELAY
+		
+		while not self.mpdOpen(self.client):
+			# Let LCD show that we are connecting, but only once
+			if (self.outage_started == None):
+				self.outage_started = monotonic()
+				print('Connection to MPD daemon failed, reconnecting...')
+				self.bus.publish(event_bus.CONNECTION_CHANGED, False)
+					
+			time.sleep(delay)
+			delay = min(delay * 2, RECONNECT_DELAY_MAX)
+			
+		# We are connected, remember how long it took
+		if (self.outage_started != None):
+			self.last_outage = monotonic() - self.outage_started
+			self.longest_outage = max(self.longest_outage, self.last_outage)
+			self.total_outage += self.last_outage
+			self.outage_started = None
+			
+			# First connection isn't reconnect
+			if self.connected_once:
+				self.reconnects += 1
+				
+		self.connected = True
+		self.connected_once = True
+		
+	# Function which is called when connection is lost
+	def mpdDisconnected(self):
+		self.connected = False
+		self.outage_started = monotonic()
+		print('Connection to MPD daemon lost, reconnecting...')
+		self.bus.publish(event_bus.CONNECTION_CHANGED, False)
+			
+	# Return connection statistics: number of reconnects, whether we are connected
+	# and last, longest and total outage duration (in seconds), current outage is included
+	def getConnectionStats(self):
+		stats = {
+			'connected': self.connected,
+			'reconnects': self.reconnects,
+			'last_outage': self.last_outage,
+			'longest_outage': self.longest_outage,
+			'total_outage': self.total_outage
+		}
 		
+		# Outage is still going on
+		if (self.outage_started != None):
+			current = monotonic() - self.outage_started
+			stats['longest_outage'] = max(stats['longest_outage'], current)
+			stats['total_outage'] += current
+			
+		return stats
+		
+	# Start MPD thread
+	def start(self):
 		# Main Thread - Start main thread which waits for changes
 		self.mpd_t = threading.Thread(target=self.mpdMain, args = ()) # Create thread
 		self.mpd_t.daemon = True # Yep, it's a daemon, when main thread finish, this one will finish too
 		self.mpd_t.start() # Start it!
 		
-		# Counter Thread - we have to count elapsed time, playtime and uptime
-		self.counter_t = threading.Thread(target=self.timeCounter, args = ()) # Create thread
-		self.counter_t.daemon = True # Yep, it's a daemon, when main thread finish, this one will finish too
-		self.counter_t.start() # Start it!
-		
-	# Wait for all threads to finish
+	# Wait for thread to finish
 	def join(self):
-		# Wait for MPD ping thread to finish
-		self.mpdping_t.join()
-		
 		# Wait for main thread to finish
 		self.mpd_t.join()
-	
-		# Wait for counter thread to finish
-		self.counter_t.join()
 			
+	# Return tag prepared for LCD: every first letter is uppercase and it's encoded for LCD charset
+	# Results are cached, web radio sends the same station name (and often title) again and again
+	def normalizeTag(self, tag):
+		# Tag can have more values (for example, more artists)
+		if isinstance(tag, list):
+			tag = ', '.join(tag)
+			
+		try:
+			temp = self.tag_cache.pop(tag)
+			self.tag_hits += 1
+		except KeyError:
+			temp = lcd_charset.encode(self.toUpper(tag.decode('utf-8', 'replace')))
+			self.tag_misses += 1
+			
+			# Remove the least recently used one
+			if (len(self.tag_cache) >= TAG_CACHE_SIZE):
+				self.tag_cache.popitem(False)
+				
+		self.tag_cache[tag] = temp
+		return temp
+		
+	# Return tag cache statistics: hits, misses and hit rate (0 - 1)
+	def getTagCacheStats(self):
+		total = self.tag_hits + self.tag_misses
+		
+		if (total > 0):
+			rate = float(self.tag_hits) / total
+		else:
+			rate = 0.0
+			
+		return {'hits': self.tag_hits, 'misses': self.tag_misses, 'hit_rate': rate}
+		
 	# Function for setting every first letter of word to uppercase
 	def toUpper(self, data):
 		#Declare list
@@ -139,267 +343,411 @@ class mpd_client:
 		# Return joined list
 		return " ".join(lst)
 		
-	# This function is called by buttons to give commands to MPD
+	# This function is called by buttons and remote to give commands to MPD
+	# Commands: PLAY (play/pause), STOP, NEXT, PREV, VUP, VDN, SHUFFLE, REPEAT and SINGLE
+	# Command is only queued, main thread stops waiting for changes (noidle) and sends it
 	def commands(self, command):
+		# Commands can't be given while we aren't connected
+		if not self.connected:
+			return
+			
+		self.command_queue.append(command)
+		os.write(self.wake_write, 'x')
+		
+	# Send all queued commands, it's called by main thread while it isn't idle
+	# Runs of volume or skip commands are sent as one command
+	def runCommands(self):
+		while self.command_queue:
+			command = self.command_queue.popleft()
+			
+			try:
+				if (command in VOLUME_STEPS):
+					self.setVolume(self.takeRun(command, VOLUME_STEPS))
+					
+				elif (command in SKIP_STEPS):
+					self.skip(self.takeRun(command, SKIP_STEPS))
+					
+				elif (command in TOGGLE_OPTIONS):
+					if (self.takeRun(command, {command: 1}) % 2):
+						self.toggleOption(command)
+					
+				else:
+					self.sendCommand(command)
+					
+			except CommandError as e:
+				print('MPD command failed: ' + str(e))
+				
+	# Send one command to MPD
+	def sendCommand(self, command):
 		if (command == 'PLAY'):
 			if (self.data['state'] == 1):
-				self.cmd_client.pause(1)
+				self.client.pause(1)
 			else:
-				self.cmd_client.play()
+				self.client.play()
 				
 		elif (command == 'STOP'):
-			self.cmd_client.stop()
+			self.client.stop()
 			
-		elif (command == 'NEXT'):
-			self.cmd_client.next()
+		elif (command in TOGGLE_OPTIONS):
+			self.toggleOption(command)
 			
-		elif (command == 'PREV'):
-			self.cmd_client.previous()
+	# Turn play mode option (SHUFFLE, REPEAT or SINGLE) on if it's off and off if it's on
+	def toggleOption(self, command):
+		key, name = TOGGLE_OPTIONS[command]
+		
+		if self.data[key]:
+			getattr(self.client, name)(0)
+		else:
+			getattr(self.client, name)(1)
 			
-		elif (command == 'VDN'):
-			# Get volume value
-			vol = self.data['volume'] - 5
+	# Remove the run of commands which have steps from the beginning of the queue
+	# Returns sum of their steps, command (already removed from queue) is included
+	def takeRun(self, command, steps):
+		total = steps[command]
+		
+		while (self.command_queue and self.command_queue[0] in steps):
+			total += steps[self.command_queue.popleft()]
 			
-			if (vol < 0):
-				vol = 0
+		return total
+		
+	# Return current volume, the one we asked for if MPD didn't report it yet
+	def getVolume(self):
+		if (self.target_volume != None and (monotonic() - self.target_volume_at) < VOLUME_TARGET_TIMEOUT):
+			return self.target_volume
 			
-			self.cmd_client.setvol(vol)
+		return self.data['volume']
+		
+	# Change volume by delta, in one command
+	def setVolume(self, delta):
+		vol = self.getVolume() + delta
+		
+		if (vol < 0):
+			vol = 0
+		elif (vol > 100):
+			vol = 100
+			
+		self.target_volume = vol
+		self.target_volume_at = monotonic()
+		self.client.setvol(vol)
+		
+	# Skip given number of songs forward (positive) or backward (negative), in one command
+	def skip(self, steps):
+		# Steps cancelled each other out
+		if (steps == 0):
+			return
+			
+		position = self.data['song_position']
+		length = self.data['playlist_length']
+		
+		# For one song or in shuffle mode (we don't know which song is next), let MPD choose it
+		if (abs(steps) == 1 or self.data['shuffle'] or position < 0):
+			for i in range(abs(steps)):
+				if (steps > 0):
+					self.client.next()
+				else:
+					self.client.previous()
+			return
 			
-		elif (command == 'VUP'):
-			# Get volume value
-			vol = self.data['volume'] + 5
+		position += steps
+		
+		# With repeat, playlist goes round
+		if self.data['repeat_all']:
+			self.client.play(position % length)
 			
-			if (vol > 100):
-				vol = 100
+		# Otherwise, like next() does, playing stops after the last song
+		elif (position >= length):
+			self.client.stop()
 			
-			self.cmd_client.setvol(vol)
+		else:
+			self.client.play(max(position, 0))
+			
+	# Fetch results of given MPD commands in one round trip, returns command => result
+	def fetch(self, commands):
+		self.client.command_list_ok_begin()
+		for command in commands:
+			getattr(self.client, command)()
+		results = self.client.command_list_end()
+		
+		return dict(zip(commands, results))
 		
-	# Function for updating data
-	# Returns which option has been changed (shuffle - 0, repeat all - 1, repeat single - 2, nothing changed - -1)
-	def updateData(self):
+	# Set data value and remember it in changes, if it's different
+	def setData(self, key, value, changes):
+		if (self.data[key] != value):
+			self.data[key] = value
+			changes.add(key)
+			
+	# Function for updating data, only parts which belong to changed MPD subsystems are updated
+	# If subsystems aren't given, everything is updated
+	# Returns set with names of changed data (for example 'volume', 'artist', 'shuffle')
+	def updateData(self, subsystems=None):
 		# Nothing has changed so far
-		changed = -1
+		changes = set()
+		
+		if (subsystems == None):
+			subsystems = SUBSYSTEM_COMMANDS.keys()
+			
+		# Collect commands we need, each one only once
+		commands = []
+		for subsystem in subsystems:
+			for command in SUBSYSTEM_COMMANDS.get(subsystem, ()):
+				if command not in commands:
+					commands.append(command)
+					
+		if not commands:
+			return changes
+			
+		# Fetch all of them in one round trip
+		results = self.fetch(commands)
+		
+		if ('mixer' in subsystems):
+			self.updateVolume(results['status'], changes)
+			
+		if ('options' in subsystems):
+			self.updateOptions(results['status'], changes)
+			
+		if ('player' in subsystems or 'playlist' in subsystems):
+			self.updatePlayer(results['status'], results['currentsong'], changes)
+			
+		if ('database' in subsystems):
+			self.updateStats(results['stats'], changes)
+			
+		# Let others see new data
+		if changes:
+			self.state = player_state(self.state.version + 1, self.data)
+			
+		# Return what has changed
+		return changes
 		
-		# Fetch volume
+	# Update volume from status
+	def updateVolume(self, status, changes):
 		try:
-			self.data['volume'] = int(self.client.status()['volume'])
+			self.setData('volume', int(status['volume']), changes)
 		except KeyError:
-			self.data['volume'] = 0
+			self.setData('volume', 0, changes)
 			
+		# MPD has the volume we asked for
+		if (self.data['volume'] == self.target_volume):
+			self.target_volume = None
+			
+	# Update shuffle, repeat all and repeat single from status
+	def updateOptions(self, status, changes):
+		for key, option in (('shuffle', 'random'), ('repeat_all', 'repeat'), ('repeat_single', 'single')):
+			try:
+				self.setData(key, status[option] == '1', changes)
+			except KeyError:
+				pass
+				
+	# Update player state and current song from status and current song
+	def updatePlayer(self, status, song, changes):
 		# Get state
 		try:
-			state = self.client.status()['state']
+			state = status['state']
 		except KeyError:
 			state = ''
 			
 		# Get station
 		try:
-			station = self.client.currentsong()['name']
+			station = song['name']
 		except KeyError:
 			station = ''
 			
 		# Get title
 		try:
-			title = self.client.currentsong()['title']
+			title = song['title']
 		except KeyError:
 			title = ''
 
 		# Get artist
 		try:
-			artist = self.client.currentsong()['artist']
+			artist = song['artist']
 		except KeyError:
 			artist = ''
 		
 		# Check whether the player is playing, paused or stopped
 		if (state == 'play'):
-			self.data['state'] = 1
+			state = 1
 
-		elif (state == 'stop' or state == ''):
-			self.data['state'] = 0
-			
 		elif (state == 'pause'):
-			self.data['state'] = 2
+			state = 2
+			
+		else:
+			state = 0
+			
+		# Playtime is counted only while playing, so take current values as new starting point
+		if (state != self.data['state'] and self.data['stats_at'] != None):
+			self.data['playtime'] = self.getPlaytime()
+			self.data['uptime'] = self.getUptime()
+			self.data['stats_at'] = monotonic()
+			
+		self.setData('state', state, changes)
+			
+		# Get position in playlist and playlist length
+		try:
+			self.setData('song_position', int(status['song']), changes)
+		except KeyError:
+			self.setData('song_position', -1, changes)
+			
+		try:
+			self.setData('playlist_length', int(status['playlistlength']), changes)
+		except KeyError:
+			self.setData('playlist_length', 0, changes)
 		
 		# Check if web radio is playing (radio station)
 		if(station != ''):
-			self.data['type'] = 1 # Set data type to radio
+			self.setData('type', 1, changes) # Set data type to radio
 			
 			# Get radio station name in artist field, all first letters to uppercase
-			self.data['artist'] = self.toUpper(station)
+			self.setData('artist', self.normalizeTag(station), changes)
 			
 			# Check if there is no data
 			if (title == ''):
-				self.data['title'] = '[Unknown Song]'
+				self.setData('title', '[Unknown Song]', changes)
 			
 			# Else get artist - title in title field, all first letters to uppercase
 			else:
-				self.data['title'] = self.toUpper(title)
+				self.setData('title', self.normalizeTag(title), changes)
 			
 		# Else, it's a file playing
 		else:
-			self.data['type'] = 0 # Set data type to file
+			self.setData('type', 0, changes) # Set data type to file
 			
 			# Check if there's no artist data
 			if (artist == ''):
-				self.data['artist'] = '[Unknown Artist]'
+				self.setData('artist', '[Unknown Artist]', changes)
 			
 			# Else, get artist name, all first letters to uppercase
 			else:
-				self.data['artist'] = self.toUpper(artist)
+				self.setData('artist', self.normalizeTag(artist), changes)
 				
 			# Check if there's no song title data
 			if (title == ''):
-				self.data['title'] = '[Unknown Title]'
+				self.setData('title', '[Unknown Title]', changes)
 			
 			# Else get current song title, all first letters to uppercase
 			else:		
-				self.data['title'] = self.toUpper(title)
+				self.setData('title', self.normalizeTag(title), changes)
 				
 		# If player is playing or it's paused, get elapsed time, total track time and bitrate
 		if (self.data['state'] == 1 or self.data['state'] == 2):
 			# If file is playing, get total track time
 			if (self.data['type'] == 0):
 				try:
-					self.data['total_time'] = int(self.client.currentsong()['time'])
+					self.setData('total_time', int(song['time']), changes)
 				except KeyError:
-					self.data['total_time'] = 0
+					self.setData('total_time', 0, changes)
 					
 			# Else, if radio is playing, there's no total track time
 			else:
-				self.data['total_time'] = 0
+				self.setData('total_time', 0, changes)
 			
-			# Get elapsed time and convert it to seconds (int)
+			# Get elapsed time and remember when we got it, current value is calculated from it
 			try:
-				self.data['elapsed_time'] = int(math.floor(float(self.client.status()['elapsed'])))
+				self.data['elapsed'] = float(status['elapsed'])
 			except KeyError:
-				self.data['elapsed_time'] = 0
+				self.data['elapsed'] = 0.0
+				
+			self.data['elapsed_at'] = monotonic()
+			changes.add('elapsed_time')
 				
 			# Get track/station bitrate
 			try:
-				self.data['bitrate'] = int(self.client.status()['bitrate'])
+				self.setData('bitrate', int(status['bitrate']), changes)
 			except KeyError:
-				self.data['bitrate'] = 0
+				self.setData('bitrate', 0, changes)
 		
 		# Else, put elapsed time to zero
 		else:
-			self.data['elapsed_time'] = 0		
-		
-		# Get total playtime and uptime from last reboot
+			if (self.data['elapsed'] != 0.0):
+				self.data['elapsed'] = 0.0
+				changes.add('elapsed_time')
+			
+	# Update total playtime and uptime from last reboot from stats
+	def updateStats(self, stats, changes):
 		try:
-			self.data['uptime'] = int(self.client.stats()['uptime'])
+			self.data['uptime'] = int(stats['uptime'])
 		except KeyError:
 			self.data['uptime'] = 0
 			
 		try:
-			self.data['playtime'] = int(self.client.stats()['playtime'])
+			self.data['playtime'] = int(stats['playtime'])
 		except KeyError:
 			self.data['playtime'] = 0
-		
-		# Get shuffle state
-		try:
-			temp = self.client.status()['random']
-			if (temp == '0'):
-				temp = False
-			elif (temp == '1'):
-				temp = True
-			
-			# Check if shuffle has changed
-			if (temp != self.data['shuffle']):
-				changed = 0 # Shuffle has changed
-				self.data['shuffle'] = temp # Update data
-		except KeyError:
-			pass
-			
-		# Get repeat all state
-		try:
-			temp = self.client.status()['repeat']
-			if (temp == '0'):
-				temp = False
-			elif (temp == '1'):
-				temp = True
-			
-			# Check if repeat all has changed
-			if (temp != self.data['repeat_all']):
-				changed = 1 # Repeat all has changed
-				self.data['repeat_all'] = temp # Update data
-		except KeyError:
-			pass
 			
-		# Get repeat single state
-		try:
-			temp = self.client.status()['single']
-			if (temp == '0'):
-				temp = False
-			elif (temp == '1'):
-				temp = True
-			
-			# Check if repeat single has changed
-			if (temp != self.data['repeat_single']):
-				changed = 2 # Repeat single has changed
-				self.data['repeat_single'] = temp # Update data
-		except KeyError:
-			pass
-			
-		# Return what has changed
-		return changed
+		self.data['stats_at'] = monotonic()
+		changes.update(('uptime', 'playtime'))
 		
-	# Function for counters (will be running in another thread)
-	def timeCounter(self):
-		while True:
-			time.sleep(1) # Wait one second
-			self.data['uptime'] += 1 # Increase uptime
-			
-			# If player is playing
-			if (self.data['state'] == 1):
-				self.data['elapsed_time'] += 1 # Increase elapsed time
-				self.data['playtime'] += 1 # Increase total playtime
-				
-			# Time is changed, notify LCD thread
-			self.LCD_client.time_change()
-			
-	# Function which returns data for LCD display to get it
+	# Return current song elapsed time in seconds (float), from the latest snapshot
+	def getElapsed(self):
+		return self.state.getElapsed()
+		
+	# Return current total uptime from last reboot in seconds (float), from the latest snapshot
+	def getUptime(self):
+		return self.state.getUptime()
+		
+	# Return current total playing time from last reboot in seconds (float), from the latest snapshot
+	def getPlaytime(self):
+		return self.state.getPlaytime()
+		
+	# Function which returns data for LCD display to get it, snapshot (player_state) of it
+	# Take it once and use it for the whole frame, it won't change meanwhile
 	def getData(self):
-		return self.data
+		return self.state
 			
 	# Main function which is running in thread and waiting for changes
 	def mpdMain(self):	
 		while True:
-			# Wait for any change from MPD
-			self.client.send_idle()
-			status = self.client.fetch_idle()
-			
-			# Update data
-			changed = self.updateData()
-
-			# Check if some option changed
-			if (changed != -1):
-				temp = False
+			# Connect (again) if we aren't connected, it returns when connection is made
+			if not self.connected:
+				self.mpdReconnect()
 				
-				# Get changed option state
-				if (changed == 0):
-					# Shuffle changed
-					temp = self.data['shuffle']
-					
-				elif (changed == 1):
-					# Repeat all changed
-					temp = self.data['repeat_all']
+				# Commands given before connection was lost aren't valid anymore
+				self.command_queue.clear()
+				
+				try:
+					# Everything could change while we weren't connected
+					self.updateData()
+				except CONNECTION_ERRORS:
+					self.mpdDisconnected()
+					continue
+				
+				# Let LCD know that we are back, it will refresh everything
+				self.bus.publish(event_bus.CONNECTION_CHANGED, True)
 					
-				elif (changed == 2):
-					# Repeat single changed
-					temp = self.data['repeat_single']
-			
-				self.LCD_client.play_mode_changed(changed, temp) # Notify LCD
-			
-			# Check what has changed
 			try:
-				type = status[0]
-			except KeyError:
+				# Send commands which came while we were waiting
+				self.runCommands()
+				
+				# Wait for any change from MPD or for a new command
+				self.client.send_idle()
+				ready = select.select([self.client, self.wake_read], [], [])[0]
+				
+				# Command came, so we don't want to wait anymore
+				if (self.wake_read in ready):
+					os.read(self.wake_read, 4096)
+					
+				# We get all subsystems which have changed, after noidle there can be none
+				if (self.client in ready):
+					subsystems = self.client.fetch_idle()
+				else:
+					subsystems = self.client.noidle()
+					
+				# Update only data which belongs to them
+				changes = self.updateData(subsystems)
+				
+			# Connection is lost (MPD restarted or stopped), we will reconnect and idle again
+			except CONNECTION_ERRORS:
+				self.mpdDisconnected()
 				continue
 			
 			# If volume has changed
-			if (type == 'mixer'):
-				self.LCD_client.volume_changed(self.data['volume'])
-			
-			# Else, if song or something from player changed
-			elif (type == 'player'):
-				self.LCD_client.data_change()
\ No newline at end of file
+			if ('mixer' in subsystems):
+				self.bus.publish(event_bus.VOLUME_CHANGED, self.data['volume'])
+				
+			# Check if some option changed: shuffle - 0, repeat all - 1, repeat single - 2
+			for type, key in enumerate(PLAY_MODES):
+				if (key in changes):
+					self.bus.publish(event_bus.PLAY_MODE_CHANGED, type, self.data[key]) # Notify LCD
+					
+			# If song or something from player changed, let LCD know; it finds out what from snapshots
+			if changes.intersection(PLAYER_DATA):
+				self.bus.publish(event_bus.DATA_CHANGED)
@@ -0,0 +1,225 @@
+import socket, struct, threading, os, time
+
+# Netlink constants (from linux/netlink.h, linux/rtnetlink.h and linux/if_addr.h)
+NETLINK_ROUTE = 0
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV6_IFADDR = 0x100
+
+NLM_F_REQUEST = 0x01
+NLM_F_DUMP = 0x300
+
+NLMSG_DONE = 3
+
+RTM_NEWADDR = 20
+RTM_DELADDR = 21
+RTM_GETADDR = 22
+
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+
+# Delay before trying to open the socket again, if it fails (in seconds)
+RESYNC_DELAY = 2
+
+# Addresses with scope link (fe80::) or host (127.0.0.1) are not shown
+RT_SCOPE_LINK = 253
+
+NLMSGHDR = struct.Struct('=LHHLL') # length, type, flags, sequence, pid
+IFADDRMSG = struct.Struct('=BBBBL') # family, prefix length, flags, scope, interface index
+RTATTR = struct.Struct('=HH') # length, type
+
+# Netlink messages and attributes are aligned to 4 bytes
+def align(length):
+	return (length + 3) & ~3
+
+# Instance of this class keeps a map of network interfaces and their addresses
+# It listens for address changes from the kernel (rtnetlink) on one socket, so nothing has to be polled
+class network_monitor:
+	# Class constructor
+	def __init__(self):
+		# Interface index => list of (interface name, family, address)
+		self.addresses = {}
+		self.lock = threading.Lock()
+
+		# Interface index => name
+		self.names = {}
+
+		# Addresses read by the current dump, they replace all addresses when it's done (None - no dump)
+		self.dumped = None
+
+		# Initialize display client
+		self.display = False
+
+		# No thread currently
+		self.network_t = False
+
+		try:
+			self.sock = self.open_socket()
+		except (socket.error, AttributeError):
+			print('Network monitor is not available, IP addresses will not be shown!')
+			self.sock = None
+
+	# Open netlink socket and subscribe to IPv4 and IPv6 address changes
+	def open_socket(self):
+		sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+		sock.bind((0, RTMGRP_IPV4_IFADDR | RTMGRP_IPV6_IFADDR))
+		return sock
+
+	# Ask for all current addresses, changes will come after them
+	# Until the dump is done, addresses (and changes) are collected separately
+	def dump(self):
+		self.dumped = {}
+		request = IFADDRMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0)
+		self.sock.send(NLMSGHDR.pack(NLMSGHDR.size + len(request), RTM_GETADDR, NLM_F_REQUEST | NLM_F_DUMP, 1, 0) + request)
+
+	# Messages were lost (for example, ENOBUFS when socket buffer overran during link flaps)
+	# Open the socket again and read all addresses and interface names from the start
+	def resync(self):
+		self.sock.close()
+		self.sock = self.open_socket()
+		self.names = {}
+		self.dump()
+
+	# Register display client so this thread can notify it about changes
+	def register(self, display):
+		self.display = display
+
+	# Return all shown addresses, list of (interface name, family, address), IPv4 addresses first
+	def get_addresses(self):
+		with self.lock:
+			addresses = []
+			for index in self.addresses:
+				addresses.extend(self.addresses[index])
+
+		addresses.sort(key = lambda item: (item[1] != socket.AF_INET, item[0]))
+		return addresses
+
+	# Check if interface is wireless
+	def is_wireless(self, ifname):
+		return os.path.isdir('/sys/class/net/' + ifname + '/wireless')
+
+	# Return interface name for its index
+	def get_name(self, index):
+		if index not in self.names:
+			# Python 3 knows how to do it
+			try:
+				self.names[index] = socket.if_indextoname(index)
+			except (AttributeError, socket.error):
+				# Otherwise, look for it in sysfs
+				for name in os.listdir('/sys/class/net'):
+					try:
+						with open('/sys/class/net/' + name + '/ifindex') as f:
+							self.names[int(f.read())] = name
+					except (IOError, ValueError):
+						pass
+
+		return self.names.get(index, str(index))
+
+	# Handle one RTM_NEWADDR or RTM_DELADDR message, returns whether something changed
+	def handle_address(self, type, payload):
+		family, prefixlen, flags, scope, index = IFADDRMSG.unpack_from(payload, 0)
+
+		if (scope >= RT_SCOPE_LINK or family not in (socket.AF_INET, socket.AF_INET6)):
+			return False
+
+		# Read attributes, local address is preferred (on point-to-point links, address is the peer)
+		attributes = {}
+		position = IFADDRMSG.size
+		while (position + RTATTR.size <= len(payload)):
+			length, attribute = RTATTR.unpack_from(payload, position)
+			if (length < RTATTR.size):
+				break
+			attributes[attribute] = payload[position + RTATTR.size:position + length]
+			position += align(length)
+
+		value = attributes.get(IFA_LOCAL, attributes.get(IFA_ADDRESS))
+		if (value == None):
+			return False
+
+		address = socket.inet_ntop(family, value)
+		entry = (self.get_name(index), family, address)
+
+		with self.lock:
+			# While dumping, addresses go to the new map
+			if (self.dumped != None):
+				addresses = self.dumped
+			else:
+				addresses = self.addresses
+
+			entries = addresses.setdefault(index, [])
+
+			if (type == RTM_NEWADDR):
+				if entry in entries:
+					return False
+				entries.append(entry)
+
+			else:
+				if entry not in entries:
+					return False
+				entries.remove(entry)
+
+				if not entries:
+					del addresses[index]
+
+		return True
+
+	# Handle all messages in one datagram, returns whether something changed
+	def handle_messages(self, data):
+		changed = False
+		position = 0
+
+		while (position + NLMSGHDR.size <= len(data)):
+			length, type, flags, sequence, pid = NLMSGHDR.unpack_from(data, position)
+			if (length < NLMSGHDR.size):
+				break
+
+			payload = data[position + NLMSGHDR.size:position + length]
+			position += align(length)
+
+			if (type == RTM_NEWADDR or type == RTM_DELADDR):
+				if (self.handle_address(type, payload) and self.dumped == None):
+					changed = True
+
+			# Dump is done, its addresses replace the old ones
+			elif (type == NLMSG_DONE and self.dumped != None):
+				with self.lock:
+					if (self.dumped != self.addresses):
+						changed = True
+					self.addresses = self.dumped
+					self.dumped = None
+
+		return changed
+
+	# Main thread
+	def network_thread(self):
+		self.dump()
+
+		while True:
+			try:
+				data = self.sock.recv(65536)
+			except socket.error as e:
+				print('Network monitor lost messages (' + str(e) + '), reading all addresses again')
+				try:
+					self.resync()
+				except socket.error:
+					# Try again after a while, closed socket makes recv fail
+					self.sock.close()
+					time.sleep(RESYNC_DELAY)
+				continue
+
+			# Notify display only if some address appeared or disappeared
+			if (self.handle_messages(data) and self.display != False):
+				self.display.network_change()
+
+	# Start network monitor thread
+	def start(self):
+		if (self.sock == None):
+			return
+
+		self.network_t = threading.Thread(target=self.network_thread, args = ()) # Create thread for monitoring network
+		self.network_t.daemon = True # Yep, it's a daemon, when main thread finish, this one will finish too
+		self.network_t.start() # Start it!
+
+	# Function for waiting the thread to finish
+	def join(self):
+		if (self.network_t != False):
+			self.network_t.join()
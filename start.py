@@ -4,7 +4,7 @@
 # Schematic, details and tutorial: /                     #
 ##########################################################
 
-import i2c_display, mpd_client, ir_remote, time, buttons
+import i2c_display, emulated_display, mpd_client, ir_remote, input_remote, time, buttons, gpio_buttons
 
 #########  MPD PARAMETERS  ##############
 # Only if you know what you're doing!
@@ -26,6 +26,7 @@ LCD_ENABLE = True
 
 # This program supports I2C and parallel connection for display
 # Choose between I2C and parallel: 0 - for I2C, 1 - for parallel
+# 2 - in-memory emulator, for testing without a Pi (nothing is shown)
 DISPLAY_TYPE = 0
 
 # Specify I2C display address (usually 0x27)
@@ -79,16 +80,31 @@ VDN_BUTTON = 12
 VUP_BUTTON = 13
 STOP_BUTTON = 15
 
-# Specify time to ignore button after press (in miliseconds)
-BOUNCE_TIME = 200
+# Specify how long button must stay pressed or released to be accepted (in miliseconds)
+# Holding PLAY for a second stops playback, holding VUP or VDN keeps changing volume
+BOUNCE_TIME = 20
+
+# Choose how buttons are read: 0 - RPi.GPIO, 1 - GPIO character device (Linux 5.10+, RPi.GPIO isn't needed)
+BUTTONS_TYPE = 0
+
+# Specify GPIO character device for BUTTONS_TYPE = 1
+GPIO_CHIP = '/dev/gpiochip0'
+
+# For BUTTONS_TYPE = 1 button edges can be saved to a file (BUTTONS_RECORD) and later
+# read from it instead of GPIO (BUTTONS_REPLAY), put None to disable them
+BUTTONS_RECORD = None
+BUTTONS_REPLAY = None
 
 #########################################################################################
 
 ############## IR REMOTE ############################################
-# Remote is used to switch between different screens
-# And to turn on/off LCD backlight
+# Remote is used to control playback (play, volume, shuffle...), to switch
+# between different screens, to turn on/off LCD backlight and to power off or reboot
 # It uses LIRC for this so you need to install and configure LIRC
-# It receives command through pipeline so in your LIRC for example:
+# Key presses are read directly from lircd socket, nothing else is needed
+# If lircd socket isn't available, it receives commands through pipeline (FIFO, it's made
+# when remote starts); while lircd socket is used, keys from pipeline are ignored
+# so in your LIRC (irexec) for example:
 # begin
 # prog = irexec
 # button = KEY_MUTE
@@ -100,32 +116,57 @@ BOUNCE_TIME = 200
 # WARNING: Don't enable it if you don't have working LIRC!!!
 REMOTE_ENABLE = True
 
+# Choose how key presses are received: 0 - LIRC (lircd socket or pipeline),
+# 1 - kernel input devices (IR receiver decoded by kernel, USB keypad...), LIRC isn't needed
+REMOTE_TYPE = 0
+
+# Specify input devices for REMOTE_TYPE = 1, paths in /dev/input/by-id don't change after reboot
+INPUT_DEVICES = ['/dev/input/event0']
+
+# Specify lircd socket path (usually /var/run/lirc/lircd)
+LIRC_SOCKET = '/var/run/lirc/lircd'
+
 # Specify pipeline name (in upper example this is "/tmp/irpipe"
 IR_PIPELINE = '/tmp/irpipe'
+
+# Which key does what, see ir_remote.py for default keys and all actions
+# Actions: PLAY, STOP, NEXT, PREV, VUP, VDN, SHUFFLE, REPEAT, SINGLE (MPD),
+# SCREEN, BACKLIGHT (display), POWEROFF and REBOOT (key must be held for 3 seconds,
+# so it works only with lircd socket or input devices, pipeline doesn't know if key is held)
+# To change a key, add for example: IR_KEYS['KEY_OK'] = 'SCREEN'
+IR_KEYS = dict(ir_remote.KEYS)
 #####################################################################
 
-# Initialize MPD client
+# Initialize MPD client, it's started when everyone has subscribed to its changes
 mpdcl = mpd_client.mpd_client(CON_ID, PASSWORD)
 
-# Start it
-mpdcl.start()
-
 # If enabled, nitialize display instance
 if LCD_ENABLE:
 	# I2C display is chosen
 	if (DISPLAY_TYPE == 0):
 		display = i2c_display.i2c_display(I2C_DISPLAY_ADDRESS, LCD_ROWS, LCD_COLUMNS, TEMPORARY_SCREEN_PERIOD, SCROLLING_PERIOD)
+		
+	# Emulated display is chosen
+	elif (DISPLAY_TYPE == 2):
+		display = emulated_display.emulated_display(I2C_DISPLAY_ADDRESS, LCD_ROWS, LCD_COLUMNS, TEMPORARY_SCREEN_PERIOD, SCROLLING_PERIOD)
 	
-	# Let MPD and display know for each other
+	# Let display know about MPD, it subscribes to its changes
 	display.register(mpdcl)
-	mpdcl.register(display)
 	
 	# Start display thread
 	display.start()
 
 # If remote is enabled, initialize it and start it's thread
 if REMOTE_ENABLE:
-	remote = ir_remote.remote(IR_PIPELINE)
+	# LIRC remote is chosen
+	if (REMOTE_TYPE == 0):
+		remote = ir_remote.remote(IR_PIPELINE, LIRC_SOCKET, IR_KEYS)
+		
+	# Input devices are chosen
+	elif (REMOTE_TYPE == 1):
+		remote = input_remote.input_remote(INPUT_DEVICES, IR_KEYS)
+		
+	remote.register_mpd(mpdcl)
 	remote.start()
 
 	# Let it know about display, if display is enabled
@@ -143,10 +184,20 @@ if BUTTONS_ENABLE:
 		'STOP_BUTTON': STOP_BUTTON
 	}
 
-	btn = buttons.buttons(button_pins, BOUNCE_TIME)
+	# RPi.GPIO is chosen
+	if (BUTTONS_TYPE == 0):
+		btn = buttons.buttons(button_pins, BOUNCE_TIME)
+		
+	# GPIO character device is chosen
+	elif (BUTTONS_TYPE == 1):
+		btn = gpio_buttons.gpio_buttons(button_pins, BOUNCE_TIME, GPIO_CHIP, BUTTONS_RECORD, BUTTONS_REPLAY)
 	
 	# Register MPD client
 	btn.register(mpdcl)
+	btn.start()
+	
+# Start MPD client
+mpdcl.start()
 
 # Wait for MPD client thread to finish
 mpdcl.join()
@@ -0,0 +1,90 @@
+import os, time, threading
+from clock import monotonic
+
+# Instance of this class reads CPU temperature and RAM usage without starting any process
+# Files are opened only once, on every sample we just seek to the beginning and read them again
+# Values are sampled at most once per interval, in between screens get cached values
+class system_metrics:
+	# Class constructor, receives sampling interval in seconds
+	def __init__(self, interval, thermal_path='/sys/class/thermal/thermal_zone0/temp', meminfo_path='/proc/meminfo'):
+		self.interval = interval
+
+		# Open files, we will keep them open all the time
+		self.thermal_fd = self.open_file(thermal_path)
+		self.meminfo_fd = self.open_file(meminfo_path)
+
+		# Cached values: temperature (string) and RAM info in kB (total, used, free)
+		self.temperature = ''
+		self.ram = (0, 0, 0)
+
+		# Time of the last sample, initially we don't have any
+		self.sampled = None
+
+		self.lock = threading.Lock()
+
+	# Open file for reading, returns file descriptor or None if it doesn't exist
+	def open_file(self, path):
+		try:
+			return os.open(path, os.O_RDONLY)
+		except OSError:
+			return None
+
+	# Read the whole file again from already opened descriptor
+	def read_file(self, fd):
+		if (fd == None):
+			return ''
+
+		os.lseek(fd, 0, os.SEEK_SET)
+		return os.read(fd, 8192)
+
+	# Take a new sample if the last one is older than interval
+	def sample(self):
+		with self.lock:
+			now = monotonic()
+			if (self.sampled != None and (now - self.sampled) < self.interval):
+				return
+
+			self.sampled = now
+
+			# Temperature is in millidegrees Celsius, show it as xy.z
+			try:
+				self.temperature = '%.1f' % (int(self.read_file(self.thermal_fd)) / 1000.0)
+			except ValueError:
+				self.temperature = ''
+
+			# Memory info is in "Name:   value kB" format
+			info = {}
+			for line in self.read_file(self.meminfo_fd).splitlines():
+				data = line.split()
+				if (len(data) >= 2):
+					info[data[0].rstrip(':')] = int(data[1])
+
+			total = info.get('MemTotal', 0)
+			free = info.get('MemFree', 0)
+
+			# Newer kernels know how much memory is really available, otherwise we calculate it
+			if ('MemAvailable' in info):
+				used = total - info['MemAvailable']
+			else:
+				used = total - free - info.get('Buffers', 0) - info.get('Cached', 0)
+
+			self.ram = (total, used, free)
+
+	# Return CPU temperature as a character string
+	def get_temperature(self):
+		self.sample()
+		return self.temperature
+
+	# Return RAM information in kB: total, used and free
+	def get_ram(self):
+		self.sample()
+		return self.ram
+
+	# Return current clock and date, formatted in-process
+	def get_datetime(self):
+		now = time.localtime()
+
+		return {
+			'clock': time.strftime('%H:%M:%S', now),
+			'date': str(now.tm_mday) + ' ' + time.strftime('%b %Y', now)
+		}
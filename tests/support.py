@@ -0,0 +1,173 @@
+''' SUPPORT - Helpers shared by tests '''
+
+# Tests are run from repository root: python -m unittest discover -s tests
+# They don't need any hardware, display is emulated, MPD is faked and buttons are replayed
+
+import os, sys, time, socket, threading
+
+# Modules of the script are in the parent directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# Wait until condition is true, returns its last result (False when timeout has passed)
+def wait_for(condition, timeout=3.0):
+	deadline = time.time() + timeout
+
+	while True:
+		result = condition()
+		if (result or time.time() >= deadline):
+			return result
+
+		time.sleep(0.01)
+
+# Return free TCP port on localhost, nothing listens on it
+def free_port():
+	temp = socket.socket()
+	temp.bind(('127.0.0.1', 0))
+	port = temp.getsockname()[1]
+	temp.close()
+
+	return port
+
+# Tiny MPD server, it knows only what mpd_client uses: status, currentsong, stats, setvol,
+# command lists and idle/noidle; every received line is logged
+class fake_mpd:
+	def __init__(self, port=0):
+		self.server = socket.socket()
+		self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		self.server.bind(('127.0.0.1', port))
+		self.server.listen(5)
+		self.port = self.server.getsockname()[1]
+
+		# What MPD returns, tests can change it and call changed()
+		self.status = {'volume': '50', 'state': 'play', 'elapsed': '12.5', 'bitrate': '320', 'random': '0',
+			'repeat': '0', 'single': '0', 'song': '1', 'playlistlength': '5'}
+		self.song = {'artist': 'some artist', 'title': 'some title', 'time': '200', 'file': 'a.mp3'}
+		self.stats = {'uptime': '100', 'playtime': '50'}
+
+		# Received lines, open connections and connections which are idle
+		self.log = []
+		self.connections = []
+		self.idlers = []
+		self.lock = threading.Lock()
+
+		thread = threading.Thread(target=self.accept_thread, args = ())
+		thread.daemon = True # Yep, it's a daemon, when main thread finish, this one will finish too
+		thread.start()
+
+	# Accept connections, each one is served by its own thread
+	def accept_thread(self):
+		while True:
+			try:
+				connection = self.server.accept()[0]
+			except socket.error:
+				return
+
+			self.connections.append(connection)
+
+			thread = threading.Thread(target=self.serve_thread, args = (connection,))
+			thread.daemon = True
+			thread.start()
+
+	# Tell idle clients that subsystems have changed
+	def changed(self, *subsystems):
+		with self.lock:
+			idlers = self.idlers
+			self.idlers = []
+
+		for connection in idlers:
+			self.send(connection, ''.join('changed: ' + name + '\n' for name in subsystems) + 'OK\n')
+
+	# Send raw data to idle clients (malformed replies)
+	def send_idle(self, data):
+		with self.lock:
+			idlers = self.idlers
+			self.idlers = []
+
+		for connection in idlers:
+			self.send(connection, data)
+
+	# Close all connections, like MPD which was stopped; stop=True also stops listening
+	def kill(self, stop=False):
+		# Shutdown wakes accept thread up, otherwise the port would stay taken
+		if stop:
+			self.server.shutdown(socket.SHUT_RDWR)
+			self.server.close()
+
+		for connection in self.connections:
+			try:
+				connection.shutdown(socket.SHUT_RDWR)
+				connection.close()
+			except socket.error:
+				pass
+
+		self.connections = []
+
+	# Return commands client sent, without idle, command lists and data queries
+	def sent_commands(self):
+		return [line for line in self.log if line not in ('idle', 'noidle') and
+			not line.startswith(('idle ', 'command_list', 'status', 'currentsong', 'stats'))]
+
+	def send(self, connection, data):
+		try:
+			connection.sendall(data)
+		except socket.error:
+			pass
+
+	# Return response to one command (without OK)
+	def reply(self, command):
+		name = command.split(' ')[0]
+
+		if (name == 'status'):
+			data = self.status
+		elif (name == 'currentsong'):
+			data = self.song
+		elif (name == 'stats'):
+			data = self.stats
+		else:
+			if (name == 'setvol'):
+				self.status['volume'] = command.split('"')[1]
+
+			return ''
+
+		return ''.join(key + ': ' + value + '\n' for key, value in data.items())
+
+	# Serve one connection until it's closed
+	def serve_thread(self, connection):
+		self.send(connection, 'OK MPD 0.19.0\n')
+		reader = connection.makefile('r')
+		command_list = None
+
+		while True:
+			try:
+				line = reader.readline()
+			except socket.error:
+				return
+
+			if not line:
+				return
+
+			line = line.rstrip('\n')
+			self.log.append(line)
+
+			if line in ('command_list_ok_begin', 'command_list_begin'):
+				command_list = []
+
+			elif (line == 'command_list_end'):
+				self.send(connection, ''.join(self.reply(command) + 'list_OK\n' for command in command_list) + 'OK\n')
+				command_list = None
+
+			elif (command_list != None):
+				command_list.append(line)
+
+			elif line.startswith('idle'):
+				with self.lock:
+					self.idlers.append(connection)
+
+			elif (line == 'noidle'):
+				with self.lock:
+					if connection in self.idlers:
+						self.idlers.remove(connection)
+						self.send(connection, 'OK\n')
+
+			else:
+				self.send(connection, self.reply(line) + 'OK\n')
@@ -0,0 +1,101 @@
+''' Screens drawn on emulated display, directly and from MPD data '''
+
+import unittest, time
+from support import wait_for, free_port, fake_mpd
+import emulated_display, mpd_client
+
+class emulator_test(unittest.TestCase):
+	def setUp(self):
+		self.display = emulated_display.emulated_display(0x27, 4, 20, 0.5, 0.1)
+
+	# Rows of message end up on rows of the screen
+	def test_message(self):
+		self.display.lcd_message('Hello'.ljust(20) + '\n' + 'World'.ljust(20))
+
+		self.assertEqual(self.display.get_screen(), ['Hello'.ljust(20), 'World'.ljust(20), ' ' * 20, ' ' * 20])
+
+	# Custom character is stored in CGRAM and shown by its code
+	def test_custom_char(self):
+		self.display.lcd_load_custom_char(1, [1, 2, 3, 4, 5, 6, 7, 8])
+		self.display.lcd_message(chr(1) + ' icon')
+
+		self.assertEqual(self.display.get_cgram()[1], [1, 2, 3, 4, 5, 6, 7, 8])
+		self.assertEqual(self.display.get_screen()[0][:6], chr(1) + ' icon')
+
+	def test_backlight(self):
+		self.display.lcd_backlight(False)
+		self.assertFalse(self.display.get_backlight())
+
+		self.display.lcd_backlight(True)
+		self.assertTrue(self.display.get_backlight())
+
+	# Glyph uploads and backlight changes are counted to the frame which follows them
+	def test_frame_stats(self):
+		device = self.display.lcd_device
+		transactions = device.transactions
+		sent = device.bytes
+
+		self.display.lcd_backlight(True)
+		self.display.lcd_load_custom_char(0, [31] * 8)
+		self.display.lcd_message(chr(0) * 20)
+
+		self.assertEqual(list(self.display.frame_stats), [{'transactions': device.transactions - transactions, 'bytes': device.bytes - sent}])
+
+		transactions = device.transactions
+		self.display.lcd_message('x' * 20)
+
+		self.assertEqual(self.display.frame_stats[-1]['transactions'], device.transactions - transactions)
+
+class screen_test(unittest.TestCase):
+	# Display connected to MPD client, port is where MPD should be (it may not run yet)
+	def start(self, port):
+		self.mpd = mpd_client.mpd_client({'host': '127.0.0.1', 'port': str(port)}, False)
+		self.display = emulated_display.emulated_display(0x27, 4, 20, 0.5, 0.1)
+		self.display.register(self.mpd)
+		self.display.start()
+		self.mpd.start()
+
+	# Return True if any row of the screen contains text
+	def shows(self, text):
+		return any(text in row for row in self.display.get_screen())
+
+	def test_connecting(self):
+		port = free_port()
+		self.start(port)
+
+		self.assertTrue(wait_for(lambda: self.shows('Connecting to MPD')))
+
+		server = fake_mpd(port)
+		self.assertTrue(wait_for(lambda: self.shows('Some Artist'), 5))
+
+	def test_song_change(self):
+		server = fake_mpd()
+		self.start(server.port)
+		self.assertTrue(wait_for(lambda: self.shows('Some Artist')))
+
+		server.song['artist'] = 'other artist'
+		server.changed('player')
+
+		self.assertTrue(wait_for(lambda: self.shows('Other Artist')))
+
+	# Volume overlay needs speaker glyphs, its frame has to count their upload too
+	def test_volume_overlay(self):
+		server = fake_mpd()
+		self.start(server.port)
+		self.assertTrue(wait_for(lambda: self.shows('Some Artist')))
+		time.sleep(0.2)
+
+		device = self.display.lcd_device
+		frames = len(self.display.frame_stats)
+		transactions = device.transactions
+
+		self.display.volume_changed(30)
+
+		self.assertTrue(wait_for(lambda: self.shows(' Volume       30 %')))
+		time.sleep(0.05)
+
+		counted = sum(stats['transactions'] for stats in list(self.display.frame_stats)[frames:])
+		self.assertEqual(counted + self.display.pending['transactions'], device.transactions - transactions)
+
+if __name__ == '__main__':
+	unittest.main()
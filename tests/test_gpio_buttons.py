@@ -0,0 +1,100 @@
+''' Buttons replayed from recorded GPIO edges: short and long press, held repeat '''
+
+import unittest, os, time, tempfile
+from support import wait_for
+import gpio_buttons
+
+PINS = {'PLAY_BUTTON': 8, 'NEXT_BUTTON': 10, 'PREV_BUTTON': 11, 'VDN_BUTTON': 12, 'VUP_BUTTON': 13, 'STOP_BUTTON': 15}
+
+# Allowed difference between expected and real time of action (in miliseconds)
+TOLERANCE = 60
+
+# MPD client which remembers commands and when they came
+class recorder:
+	def __init__(self):
+		self.log = []
+		self.started = time.time()
+
+	def commands(self, command):
+		self.log.append((command, (time.time() - self.started) * 1000))
+
+class replay_test(unittest.TestCase):
+	def setUp(self):
+		self.sequence = 0
+		self.edges = []
+
+		handle, self.path = tempfile.mkstemp()
+		os.close(handle)
+		self.record = self.path + '.record'
+
+	def tearDown(self):
+		for path in (self.path, self.record):
+			if os.path.exists(path):
+				os.remove(path)
+
+	# Add edge at time (seconds), pressed button pulls the line down (falling edge)
+	def edge(self, at, pin, pressed):
+		self.sequence += 1
+
+		if pressed:
+			id = 2
+		else:
+			id = gpio_buttons.EVENT_RISING_EDGE
+
+		self.edges.append(gpio_buttons.LINE_EVENT.pack(int(at * 1e9), id, gpio_buttons.BOARD_TO_BCM[pin], self.sequence, self.sequence))
+
+	# Replay edges and return recorded commands, after duration (seconds)
+	def replay(self, duration):
+		with open(self.path, 'wb') as f:
+			f.write(''.join(self.edges))
+
+		mpd = recorder()
+		temp = gpio_buttons.gpio_buttons(PINS, 20, replay=self.path, record=self.record)
+		temp.register(mpd)
+
+		mpd.started = time.time()
+		temp.start()
+		time.sleep(duration)
+
+		self.assertEqual(temp.event_fds, []) # Replay pipe is closed when it's finished
+		return mpd.log
+
+	def assertTimeline(self, log, expected):
+		self.assertEqual([command for command, at in log], [command for command, at in expected])
+
+		for (command, at), (temp, expected_at) in zip(log, expected):
+			self.assertTrue(abs(at - expected_at) <= TOLERANCE, command + ' came at ' + str(int(at)) + ' ms, expected ' + str(expected_at))
+
+	def test_timeline(self):
+		self.edge(100.0, 10, True)
+		self.edge(100.1, 10, False) # NEXT
+		self.edge(100.3, 8, True)
+		self.edge(100.5, 8, False) # Short PLAY
+		self.edge(101.0, 8, True)
+		self.edge(102.3, 8, False) # Long PLAY => STOP
+		self.edge(102.5, 13, True)
+		self.edge(103.5, 13, False) # Held VUP, it's repeated faster and faster
+
+		log = self.replay(3.8)
+
+		self.assertTimeline(log, [('NEXT', 20), ('PLAY', 520), ('STOP', 2020), ('VUP', 2520), ('VUP', 3020), ('VUP', 3270), ('VUP', 3470)])
+
+		# Every replayed edge was recorded again
+		self.assertEqual(os.path.getsize(self.record), len(self.edges) * gpio_buttons.LINE_EVENT.size)
+
+	# Edges shorter than bounce time are ignored
+	def test_bounce(self):
+		self.edge(100.0, 10, True)
+		self.edge(100.005, 10, False)
+		self.edge(100.010, 10, True)
+		self.edge(100.1, 10, False)
+
+		log = self.replay(0.3)
+
+		self.assertTimeline(log, [('NEXT', 30)])
+
+	def test_board_pin(self):
+		self.assertRaises(ValueError, gpio_buttons.gpio_buttons, {'PLAY_BUTTON': 1}, 20, replay=self.path)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,91 @@
+''' MPD client against fake MPD: command coalescing and reconnecting '''
+
+import unittest, os
+from support import wait_for, free_port, fake_mpd
+import mpd_client
+
+class client_test(unittest.TestCase):
+	def start(self, port):
+		self.mpd = mpd_client.mpd_client({'host': '127.0.0.1', 'port': str(port)}, False)
+		self.mpd.start()
+
+	# Queue commands at once, like presses which come faster than MPD answers, and return what was sent
+	def send(self, commands, count=1):
+		del self.server.log[:]
+
+		self.mpd.command_queue.extend(commands)
+		os.write(self.mpd.wake_write, 'x')
+
+		self.assertTrue(wait_for(lambda: len(self.server.sent_commands()) >= count))
+		return self.server.sent_commands()
+
+class coalescing_test(client_test):
+	def setUp(self):
+		self.server = fake_mpd()
+		self.start(self.server.port)
+		self.assertTrue(wait_for(lambda: self.mpd.connected and self.server.idlers))
+
+	def test_volume_run(self):
+		self.assertEqual(self.send(['VUP'] * 5), ['setvol "75"'])
+
+	# Steps are added to volume which was sent last, MPD doesn't have to report it first
+	def test_volume_up_down(self):
+		self.assertEqual(self.send(['VUP', 'VDN', 'VDN']), ['setvol "45"'])
+		self.assertEqual(self.send(['VDN']), ['setvol "40"'])
+
+	def test_skip_run(self):
+		self.assertEqual(self.send(['NEXT'] * 3 + ['PREV']), ['play "3"'])
+
+	# Runs are broken by other commands, order is kept
+	def test_mixed(self):
+		self.assertEqual(self.send(['NEXT', 'NEXT', 'VUP', 'NEXT'], 3), ['play "3"', 'setvol "55"', 'next'])
+
+	# Without repeat, playing stops after the last song (like next() does)
+	def test_skip_bounds(self):
+		self.assertEqual(self.send(['NEXT'] * 6), ['stop'])
+		self.assertEqual(self.send(['PREV'] * 9), ['play "0"'])
+
+class reconnect_test(client_test):
+	def test_server_starts_later(self):
+		port = free_port()
+		self.start(port)
+		self.assertTrue(wait_for(lambda: self.mpd.getConnectionStats()['total_outage'] > 0))
+		self.assertFalse(self.mpd.connected)
+
+		self.server = fake_mpd(port)
+		self.assertTrue(wait_for(lambda: self.mpd.connected, 5))
+
+		self.assertEqual(self.send(['VUP']), ['setvol "55"'])
+
+	def test_server_restart(self):
+		self.server = fake_mpd()
+		port = self.server.port
+		self.start(port)
+		self.assertTrue(wait_for(lambda: self.mpd.connected))
+
+		self.server.kill(True)
+		self.assertTrue(wait_for(lambda: not self.mpd.connected))
+
+		self.server = fake_mpd(port)
+		self.assertTrue(wait_for(lambda: self.mpd.connected, 5))
+
+		stats = self.mpd.getConnectionStats()
+		self.assertEqual(stats['reconnects'], 1)
+		self.assertTrue(stats['last_outage'] > 0)
+
+		self.assertEqual(self.send(['VDN']), ['setvol "45"'])
+
+	# Malformed reply (ProtocolError) is handled like lost connection, thread keeps running
+	def test_protocol_error(self):
+		self.server = fake_mpd()
+		self.start(self.server.port)
+		self.assertTrue(wait_for(lambda: self.mpd.connected and self.server.idlers))
+
+		self.server.send_idle('this is not a valid line\n')
+
+		self.assertTrue(wait_for(lambda: self.mpd.getConnectionStats()['reconnects'] == 1, 5))
+		self.assertTrue(wait_for(lambda: self.mpd.connected))
+		self.assertTrue(self.mpd.mpd_t.is_alive())
+
+if __name__ == '__main__':
+	unittest.main()